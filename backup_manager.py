@@ -0,0 +1,154 @@
+import asyncio
+import datetime
+import os
+import sqlite3
+import time
+from typing import Optional
+import aiosqlite
+
+
+class _BackupAborted(Exception):
+    pass
+
+
+class BackupManager:
+    """Takes periodic online backups of the lobby database while the bot keeps running."""
+
+    def __init__(self, db_file: str, backup_dir: str, interval_hours: float = 6.0,
+                 keep: int = 7, pages_per_step: int = 64, step_sleep: float = 0.01, max_restarts: int = 3) -> None:
+        self.db_file = db_file
+        self.backup_dir = backup_dir
+        self.interval_hours = interval_hours
+        self.keep = keep
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.max_restarts = max_restarts
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        '''
+        Cancels the backup loop. A running copy is aborted at its next step, but a
+        single-step fallback copy can't be interrupted, so this gives up after timeout.
+        '''
+        if self._task is None:
+            return
+        self._stopping = True
+        self._task.cancel()
+        done, _ = await asyncio.wait({self._task}, timeout=timeout)
+        if not done:
+            print(f"A backup was still running after {timeout}s, not waiting for it.")
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.backup()
+            except Exception as e:
+                print(f"Backup failed: {e}")
+            await asyncio.sleep(self.interval_hours * 3600)
+
+    async def backup(self) -> Optional[str]:
+        '''
+        Copies the database page by page through SQLite's online backup API, or in
+        a single step if writes keep restarting the copy. Returns the path of the verified backup or None if the copy was corrupt.
+        '''
+        os.makedirs(self.backup_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        final_path = os.path.join(self.backup_dir, f"lobbies-{stamp}.db")
+        partial_path = final_path + ".partial"
+
+        started = time.perf_counter()
+        try:
+            copy = asyncio.ensure_future(asyncio.to_thread(self._copy, partial_path))
+            try:
+                total_pages = await asyncio.shield(copy)
+            except asyncio.CancelledError:
+                # The thread can't be interrupted from here. This makes it abort at its next step,
+                # and waiting keeps the partial file from being removed while it still writes to it
+                self._stopping = True
+                await asyncio.wait({copy})
+                if copy.done() and not copy.cancelled():
+                    copy.exception()  # the expected abort, marks it as retrieved
+                raise
+            duration = time.perf_counter() - started
+
+            if not await self._integrity_ok(partial_path):
+                print(f"Backup {partial_path} failed the integrity check.")
+                return None
+
+            os.replace(partial_path, final_path)
+        finally:
+            # A failed or corrupt copy must not be left behind, _rotate only sees finished backups
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+        pages_per_second = total_pages / duration if duration > 0 else 0.0
+        print(f"Backed up database to {final_path}: {total_pages} pages in " +
+              f"{duration:.2f}s ({pages_per_second:.0f} pages/s).")
+        self._rotate()
+        return final_path
+
+    def _copy(self, partial_path: str) -> int:
+        '''
+        Runs on a worker thread that owns both connections, so cancelling the
+        caller never closes a connection while the copy is still using it.
+        Returns the number of pages copied.
+        '''
+        total_pages = 0
+        last_remaining: Optional[int] = None
+        restarts = 0
+
+        def progress(status: int, remaining: int, total: int):
+            nonlocal total_pages, last_remaining, restarts
+            total_pages = total
+            # Raising here aborts the copy
+            if self._stopping:
+                raise _BackupAborted("backup manager is stopping")
+            # SQLite starts the copy over whenever another connection writes to the source
+            if last_remaining is not None and remaining > last_remaining:
+                restarts += 1
+                if restarts > self.max_restarts:
+                    raise _BackupAborted(f"restarted {restarts} times by concurrent writes")
+            last_remaining = remaining
+            # Lets writers take the database between steps
+            if remaining > 0:
+                time.sleep(self.step_sleep)
+
+        source = sqlite3.connect(self.db_file)
+        target = sqlite3.connect(partial_path)
+        try:
+            try:
+                source.backup(target, pages=self.pages_per_step, progress=progress)
+            except _BackupAborted as e:
+                if self._stopping:
+                    raise
+                # One step copies everything under a single read lock, so writes can't restart it.
+                # Writers wait for that lock meanwhile, which is why this is only the fallback
+                print(f"Stepped backup {e}, copying in a single step instead.")
+                source.backup(target, pages=-1)
+                total_pages = source.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            target.close()
+            source.close()
+        return total_pages
+
+    async def _integrity_ok(self, path: str) -> bool:
+        async with aiosqlite.connect(path) as db:
+            cursor = await db.execute("PRAGMA integrity_check")
+            result = await cursor.fetchone()
+            return result is not None and result[0] == "ok"
+
+    def _rotate(self):
+        backups = sorted(
+            name for name in os.listdir(self.backup_dir)
+            if name.startswith("lobbies-") and name.endswith(".db")
+        )
+        for name in backups[:-self.keep] if self.keep > 0 else []:
+            os.remove(os.path.join(self.backup_dir, name))
+            print(f"Removed old backup {name}")
@@ -1,23 +1,98 @@
 from discord.ext import commands
+from discord import app_commands
+from typing import Any, Dict
+import asyncio
 import discord
 from database_manager import DatabaseManager
+from user_cache import UserCache
+from send_queue import SendQueue
 
 
-class Bot(commands.Bot):
+class DrainingCommandTree(app_commands.CommandTree):
+    """Rejects new interactions once the bot starts shutting down and tracks the ones in flight."""
 
-    def __init__(self, database: DatabaseManager, testing_guild_id: int, testing: bool = False, **options) -> None:
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        bot = self.client
+        # Autocomplete requests end without a completion event and can't get a message reply,
+        # so only commands are tracked and told about the restart
+        is_command = interaction.type is discord.InteractionType.application_command
+        if not bot.accepting_interactions:
+            if is_command:
+                await interaction.response.send_message("The bot is restarting, please try again in a moment.", ephemeral=True)
+            return False
+        if is_command:
+            bot.in_flight.add(interaction.id)
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        self.client.finish_interaction(interaction)
+        await super().on_error(interaction, error)
+
+
+class Bot(commands.AutoShardedBot):
+
+    def __init__(self, database: DatabaseManager, testing_guild_id: int, testing: bool = False, sync_commands: bool = True, **options) -> None:
         intents = discord.Intents.default()
         intents.message_content = True
-        super().__init__(command_prefix="]", intents=intents, **options)
+        super().__init__(command_prefix="]", intents=intents,
+                         tree_cls=DrainingCommandTree, **options)
         self.db = database
+        self.user_cache = UserCache(self)
+        self.send_queue = SendQueue()
         self._testing_guild_id = testing_guild_id
         self._testing = testing
+        # Only one shard worker needs to push the command tree to Discord
+        self._sync_commands = sync_commands
+        self.accepting_interactions = True
+        self.in_flight: set[int] = set()
+        self._in_flight_done = asyncio.Event()
+
+    def finish_interaction(self, interaction: discord.Interaction):
+        self.in_flight.discard(interaction.id)
+        if not self.in_flight:
+            self._in_flight_done.set()
+
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        self.finish_interaction(interaction)
+
+    async def drain(self, timeout: float) -> bool:
+        '''
+        Stops accepting interactions and waits for the running ones, DM password prompts included.
+        Returns False if some were still running at the deadline.
+        '''
+        self.accepting_interactions = False
+        self._in_flight_done.clear()
+        if not self.in_flight:
+            return True
+        print(f"Waiting for {len(self.in_flight)} interactions to finish...")
+        try:
+            await asyncio.wait_for(self._in_flight_done.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            print(f"{len(self.in_flight)} interactions were still running at the shutdown deadline.")
+            return False
+
+    def export_warm_state(self) -> Dict[str, Any]:
+        state: Dict[str, Any] = {"user_mentions": self.user_cache.export()}
+        core = self.get_cog("BotCore")
+        if core is not None:
+            state["leaderboards"] = core.leaderboard_cache.export()
+        return state
+
+    def import_warm_state(self, state: Dict[str, Any]):
+        self.user_cache.load(state.get("user_mentions", {}))
+        core = self.get_cog("BotCore")
+        if core is not None:
+            core.leaderboard_cache.load(state.get("leaderboards", []))
 
     async def on_ready(self):
-        print(f"Connected as: {self.user}")
+        print(f"Connected as: {self.user} (shards: {sorted(self.shards)})")
 
     async def setup_hook(self):
         print("Running setup_hook...")
+        if not self._sync_commands:
+            print("Skipping command tree sync on this worker.")
+            return
         print("Syncing command tree...")
 
         if self._testing:
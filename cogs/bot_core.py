@@ -1,15 +1,22 @@
-from discord import app_commands, DMChannel, Forbidden, Message, Interaction, Embed, Color, NotFound
+from discord import app_commands, DMChannel, Forbidden, Message, Interaction, Embed, Color
 from discord.ext import commands
+from typing import Optional
 from database_manager import DatabaseManager, DatabaseEnums
+from render_cache import RenderCache
 import asyncio
 import smile
 
+LEADERBOARD_PAGE_SIZE = 10
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+HEATMAP_SHADES = " ░▒▓█"
+
 
 class BotCore(commands.Cog):
     def __init__(self, bot: commands.Bot, database: DatabaseManager):
         self.bot = bot
         print("BotCore Cog loaded.")
         self.db = database
+        self.leaderboard_cache = RenderCache(max_entries=256)
 
     async def _send_await_pm_interaction(self, interaction: Interaction, message_content: str):
         author = interaction.user
@@ -144,33 +151,81 @@ class BotCore(commands.Cog):
         await interaction.response.send_message(out_string, ephemeral=True)
 
     @app_commands.command(name="leaderboard",  description="Displays the leaderboard for the given lobby.")
-    @app_commands.describe(lobby_name="Hash value of the lobby. Can be found under 'my lobbies'")
-    async def leaderboard(self, interaction: Interaction, lobby_name: str):
+    @app_commands.describe(lobby_name="Hash value of the lobby. Can be found under 'my lobbies'",
+                           page="Page of the leaderboard to show. (Default: 1)",
+                           season="Past season to show. (Default: current season)")
+    async def leaderboard(self, interaction: Interaction, lobby_name: str, page: int = 1, season: Optional[int] = None):
         await interaction.response.defer()
-        user_id = str(interaction.user.id)
+        page = max(page, 1)
+        current_season = await self.db.get_current_season(lobby_name)
+        if season is None:
+            season = current_season
+        version = await self.db.get_lobby_version(lobby_name) if season == current_season else None
+        cache_key = self._leaderboard_cache_key(lobby_name, season, page, version)
+
+        embed = self.leaderboard_cache.get(cache_key)
+        if embed is None:
+            if season == current_season:
+                users = await self.db.get_lobby_users(lobby_name)
+            else:
+                result, users = await self.db.get_season_standings(lobby_name, season)
+                match result:
+                    case DatabaseEnums.SUCCESS:
+                        pass
+                    case DatabaseEnums.INVALID_LOBBY:
+                        await interaction.followup.send(f"Lobby with name **{lobby_name}** does not exist.", ephemeral=True)
+                        return
+                    case DatabaseEnums.INVALID_SEASON:
+                        await interaction.followup.send(f"Season **{season}** of **{lobby_name}** has not ended yet or does not exist.", ephemeral=True)
+                        return
+                    case _:
+                        await interaction.followup.send(f"Something unexpected happened.", ephemeral=True)
+                        return
+
+            # Pages past the end show the last page, and share its cache entry instead of each storing a copy
+            clamped_page = min(page, self._leaderboard_page_count(users))
+            if clamped_page != page:
+                page = clamped_page
+                cache_key = self._leaderboard_cache_key(lobby_name, season, page, version)
+                embed = self.leaderboard_cache.get(cache_key)
+        if embed is None:
+            embed = await self._render_leaderboard(lobby_name, season, users, page)
+            self.leaderboard_cache.put(cache_key, embed)
+            print(f"Rendered leaderboard for lobby {lobby_name} (season {season}, page {page}). " +
+                  f"Cache hit rate: {self.leaderboard_cache.hit_rate:.2%}")
+        else:
+            print(f"Served cached leaderboard for lobby {lobby_name} (season {season}, page {page}). " +
+                  f"Cache hit rate: {self.leaderboard_cache.hit_rate:.2%}")
+        await interaction.followup.send(embed=embed)
+
+    def _leaderboard_cache_key(self, lobby_name: str, season: int, page: int, version: Optional[str]) -> tuple:
+        # Archived seasons never change, so their pages survive new activity in the lobby
+        if version is None:
+            return (lobby_name, season, page)
+        return (lobby_name, season, page, version)
+
+    def _leaderboard_page_count(self, users: list[dict]) -> int:
+        return max((len(users) - 1) // LEADERBOARD_PAGE_SIZE + 1, 1)
+
+    async def _render_leaderboard(self, lobby_name: str, season: int, users: list[dict], page: int) -> Embed:
         embed = Embed(
-            title=f"🏆 {lobby_name}",
+            title=f"🏆 {lobby_name} (Season {season})",
             description="Top students based on their total study time.",
             color=Color.gold()
         )
 
         leaderboard_text = ""
-        users = await self.db.get_lobby_users(lobby_name)
-        users_list: list[tuple[str, int]] = []
-        for user_dict in users:
-            try:
-                user_id = user_dict["user_id"]
-                user = await self.bot.fetch_user(user_id)
-                user_mention = user.mention
-            except NotFound:
-                user_mention = f"Unknown User ({user_id})"
-
-            total_seconds = user_dict["total_seconds"]
-            users_list.append((user_mention, total_seconds))
-
-        users_list.sort(key=lambda x: x[1], reverse=True)
-        for i, (mention, total_seconds) in enumerate(users_list, 1):
-            minutes, seconds = divmod(total_seconds, 60)
+        users.sort(key=lambda x: x["total_seconds"], reverse=True)
+        page_count = self._leaderboard_page_count(users)
+        page = min(page, page_count)
+        first_rank = (page - 1) * LEADERBOARD_PAGE_SIZE + 1
+        page_users = users[first_rank - 1:first_rank -
+                           1 + LEADERBOARD_PAGE_SIZE]
+
+        for i, user_dict in enumerate(page_users, first_rank):
+            mention = await self.bot.user_cache.get_mention(user_dict["user_id"])
+
+            minutes, seconds = divmod(user_dict["total_seconds"], 60)
             hours, minutes = divmod(minutes, 60)
             leaderboard_text += (
                 f"**{i}.** {mention}\n"
@@ -180,7 +235,96 @@ class BotCore(commands.Cog):
             embed.description = leaderboard_text
         else:
             embed.description = "The leaderboard is empty!"
-        await interaction.followup.send(embed=embed)
+        embed.set_footer(text=f"Page {page}/{page_count}")
+        return embed
+
+    @app_commands.command(name="stats",  description="Shows your study statistics for the given lobby.")
+    @app_commands.describe(lobby_name="Hash value of the lobby. Can be found under 'my lobbies'")
+    async def stats(self, interaction: Interaction, lobby_name: str):
+        user_id = str(interaction.user.id)
+        result, stats = await self.db.get_user_stats(lobby_name, user_id, interaction.created_at)
+        match result:
+            case DatabaseEnums.SUCCESS:
+                await interaction.response.send_message(embed=self._render_stats(lobby_name, stats), ephemeral=True)
+            case DatabaseEnums.INVALID_LOBBY:
+                await interaction.response.send_message(f"Invalid lobby name: **{lobby_name}**", ephemeral=True)
+            case DatabaseEnums.USER_NOT_IN_LOBBY:
+                await interaction.response.send_message(f"You are not a part of **{lobby_name}**", ephemeral=True)
+            case _:
+                await interaction.response.send_message(f"Something unexpected happened.", ephemeral=True)
+
+    def _render_stats(self, lobby_name: str, stats: dict) -> Embed:
+        embed = Embed(title=f"📊 Your stats in {lobby_name}", color=Color.blue())
+
+        total_minutes = stats["total_seconds"] // 60
+        median_minutes = int(stats["lobby_median_seconds"]) // 60
+        embed.add_field(name="Total", value=f"{total_minutes // 60}h {total_minutes % 60}m", inline=True)
+        embed.add_field(name="Lobby median", value=f"{median_minutes // 60}h {median_minutes % 60}m", inline=True)
+        embed.add_field(name="Percentile", value=f"{stats['percentile']:.0f}%", inline=True)
+        embed.add_field(name="Current streak", value=f"{stats['current_streak']} days", inline=True)
+        embed.add_field(name="Longest streak", value=f"{stats['longest_streak']} days", inline=True)
+        embed.add_field(name="Sessions", value=str(stats["session_count"]), inline=True)
+
+        if stats["busiest_hour"] is None:
+            embed.description = "No finished sessions yet. Stop a chronometer to start collecting stats!"
+            return embed
+
+        heatmap = stats["heatmap"]
+        peak = max(max(row) for row in heatmap)
+        rows = []
+        for weekday, row in zip(WEEKDAYS, heatmap):
+            cells = "".join(HEATMAP_SHADES[(len(HEATMAP_SHADES) - 1) * seconds // peak]
+                            for seconds in row)
+            rows.append(f"{weekday} {cells}")
+        embed.add_field(name="Weekly heatmap (UTC, 00-23h)",
+                        value="```\n" + "\n".join(rows) + "\n```", inline=False)
+        embed.set_footer(text=f"Busiest hour: {stats['busiest_hour']:02d}:00 UTC, " +
+                         f"busiest day: {WEEKDAYS[stats['busiest_weekday']]}")
+        return embed
+
+    @app_commands.command(name="reset_lobby",  description="Archives the current season of a lobby and starts a new one.")
+    @app_commands.describe(lobby_name="Hash value of the lobby. Can be found under 'my lobbies'")
+    async def reset_lobby(self, interaction: Interaction, lobby_name: str):
+        user_id = str(interaction.user.id)
+        result, archived_season = await self.db.reset_lobby(lobby_name, user_id, interaction.created_at)
+        match result:
+            case DatabaseEnums.SUCCESS:
+                await interaction.response.send_message(f"Season **{archived_season}** of **{lobby_name}** was archived. " +
+                                                        f"Season **{archived_season + 1}** has started!", ephemeral=True)
+            case DatabaseEnums.INVALID_LOBBY:
+                await interaction.response.send_message(f"Invalid lobby name: **{lobby_name}**", ephemeral=True)
+            case DatabaseEnums.INSUFFICIENT_PRIVILAGES:
+                await interaction.response.send_message(f"You need to be an admin of **{lobby_name}** to reset it.", ephemeral=True)
+            case _:
+                await interaction.response.send_message(f"Something unexpected happened.", ephemeral=True)
+
+    @app_commands.command(name="season_schedule",  description="Automatically starts a new season every week or month.")
+    @app_commands.describe(lobby_name="Hash value of the lobby. Can be found under 'my lobbies'",
+                           period="How often a new season starts.",
+                           timezone="IANA timezone the season starts at midnight in, e.g. Europe/Istanbul. (Default: UTC)")
+    @app_commands.choices(period=[
+        app_commands.Choice(name="Weekly", value="weekly"),
+        app_commands.Choice(name="Monthly", value="monthly"),
+        app_commands.Choice(name="Off", value="off"),
+    ])
+    async def season_schedule(self, interaction: Interaction, lobby_name: str, period: app_commands.Choice[str], timezone: str = "UTC"):
+        user_id = str(interaction.user.id)
+        result = await self.db.set_season_schedule(lobby_name, user_id, period.value, timezone, interaction.created_at)
+        match result:
+            case DatabaseEnums.SUCCESS:
+                if period.value == "off":
+                    await interaction.response.send_message(f"Seasons of **{lobby_name}** will no longer reset automatically.", ephemeral=True)
+                else:
+                    await interaction.response.send_message(f"A new season of **{lobby_name}** will start {period.name.lower()} " +
+                                                            f"at midnight ({timezone}).", ephemeral=True)
+            case DatabaseEnums.INVALID_LOBBY:
+                await interaction.response.send_message(f"Invalid lobby name: **{lobby_name}**", ephemeral=True)
+            case DatabaseEnums.INSUFFICIENT_PRIVILAGES:
+                await interaction.response.send_message(f"You need to be an admin of **{lobby_name}** to change its schedule.", ephemeral=True)
+            case DatabaseEnums.INVALID_SCHEDULE:
+                await interaction.response.send_message(f"Unknown timezone: **{timezone}**", ephemeral=True)
+            case _:
+                await interaction.response.send_message(f"Something unexpected happened.", ephemeral=True)
 
     @app_commands.command(name="join_lobby",  description="Tries joining a certain lobby.")
     @app_commands.describe(lobby_name="Hash value of the lobby")
@@ -0,0 +1,155 @@
+from discord import app_commands, Interaction, Embed, Color, TextChannel, AllowedMentions, Forbidden, HTTPException
+from discord.ext import commands
+from database_manager import DatabaseManager, DatabaseEnums
+from season_scheduler import next_season_reset
+from typing import Any, Dict, Optional
+import asyncio
+import datetime
+
+DIGEST_TOP_K = 10
+DIGEST_BATCH_SIZE = 50
+DIGEST_MAX_SLEEP = 60.0
+DIGEST_MIN_SLEEP = 1.0
+DIGEST_RETRY_DELAY = 60.0
+DIGEST_MAX_ATTEMPTS = 5
+
+
+class Digests(commands.Cog):
+    def __init__(self, bot: commands.Bot, database: DatabaseManager):
+        self.bot = bot
+        print("Digests Cog loaded.")
+        self.db = database
+        self._task: Optional[asyncio.Task] = None
+        self._stop_requested = asyncio.Event()
+        # lobby_hash -> failed attempts at this week's digest, only kept by the worker retrying it
+        self._failed_attempts: Dict[str, int] = {}
+
+    async def cog_load(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def cog_unload(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def stop(self, timeout: float):
+        '''
+        Lets the digest being posted finish, so its cursor moves and it isn't posted
+        again after a restart, then stops. Cancels the loop if that takes over timeout.
+        '''
+        if self._task is None:
+            return
+        self._stop_requested.set()
+        done, _ = await asyncio.wait({self._task}, timeout=timeout)
+        if not done:
+            print(f"Digest scheduler still busy after {timeout}s, cancelling it.")
+            self._task.cancel()
+            await asyncio.wait({self._task})
+        self._task = None
+
+    async def _run(self):
+        await self.bot.wait_until_ready()
+        while not self._stop_requested.is_set():
+            sleep_for = DIGEST_MAX_SLEEP
+            try:
+                now = datetime.datetime.now(datetime.timezone.utc)
+                shard_count = self.bot.shard_count or 1
+                shard_ids = self.bot.shard_ids or list(range(shard_count))
+                due = await self.db.get_due_digests(now, shard_count, shard_ids, DIGEST_BATCH_SIZE)
+
+                for digest in due:
+                    if self._stop_requested.is_set():
+                        return
+                    await self._post_digest(digest, now)
+
+                # Failed digests were pushed back, so a full batch always means there is more to send
+                if len(due) == DIGEST_BATCH_SIZE:
+                    continue
+                else:
+                    next_due_ts = await self.db.get_next_digest_due(shard_count, shard_ids)
+                    if next_due_ts is not None:
+                        sleep_for = min(max(next_due_ts - now.timestamp(), DIGEST_MIN_SLEEP), DIGEST_MAX_SLEEP)
+            except Exception as e:
+                print(f"Digest scheduler failed: {e}")
+            try:
+                await asyncio.wait_for(self._stop_requested.wait(), sleep_for)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _post_digest(self, digest: Dict[str, Any], now: datetime.datetime):
+        lobby_hash = digest["lobby_hash"]
+        due_time = datetime.datetime.fromtimestamp(digest["next_due_ts"], datetime.timezone.utc)
+        # The digest covers the week (Monday to Monday, UTC) that ended before it was due
+        week_end = next_season_reset("weekly", "UTC", due_time - datetime.timedelta(days=7))
+        week_start = week_end - datetime.timedelta(days=7)
+        try:
+            channel = self.bot.get_channel(int(digest["channel_id"]))
+            if channel is None:
+                print(f"Digest channel {digest['channel_id']} of lobby {lobby_hash} is gone, skipping this week.")
+            else:
+                top_users = await self.db.get_top_lobby_users(digest["name"], week_start, week_end, DIGEST_TOP_K)
+                if top_users:
+                    embed = await self._render_digest(digest["name"], top_users, week_start, week_end)
+                    try:
+                        await self.bot.send_queue.send(channel, embed=embed, allowed_mentions=AllowedMentions.none())
+                    except Forbidden:
+                        print(f"No permission to post the digest of lobby {lobby_hash} in #{channel}, skipping this week.")
+        except Exception as e:
+            # Anything that fails while building or sending (Discord, the storage service) is retried with
+            # backoff, so this digest leaves the head of the queue instead of failing the whole batch
+            attempts = self._failed_attempts.get(lobby_hash, 0) + 1
+            if attempts < DIGEST_MAX_ATTEMPTS:
+                self._failed_attempts[lobby_hash] = attempts
+                retry_ts = int(now.timestamp() + DIGEST_RETRY_DELAY * 2 ** (attempts - 1))
+                print(f"Could not post the digest of lobby {lobby_hash} (attempt {attempts}/{DIGEST_MAX_ATTEMPTS}): {e}")
+                await self.db.postpone_digest(lobby_hash, digest["next_due_ts"], retry_ts)
+                return
+            print(f"Could not post the digest of lobby {lobby_hash} after {attempts} attempts, skipping this week: {e}")
+
+        # Cursor only moves after the post, so a restart retries instead of skipping
+        self._failed_attempts.pop(lobby_hash, None)
+        await self.db.mark_digest_sent(lobby_hash, digest["next_due_ts"], now)
+
+    async def _render_digest(self, lobby_name: str, top_users: list[dict], week_start: datetime.datetime, week_end: datetime.datetime) -> Embed:
+        embed = Embed(
+            title=f"📅 Weekly top {DIGEST_TOP_K}: {lobby_name}",
+            color=Color.gold()
+        )
+        digest_text = ""
+        for i, user_dict in enumerate(top_users, 1):
+            mention = await self.bot.user_cache.get_mention(user_dict["user_id"])
+            minutes, seconds = divmod(user_dict["total_seconds"], 60)
+            hours, minutes = divmod(minutes, 60)
+            digest_text += f"**{i}.** {mention} - **{hours}**h **{minutes}**m\n"
+        embed.description = digest_text
+        last_day = week_end - datetime.timedelta(days=1)
+        embed.set_footer(text=f"Study time from {week_start:%b %d} to {last_day:%b %d} (UTC)")
+        return embed
+
+    @app_commands.command(name="digest",  description="Posts the lobby's weekly top 10 to a channel.")
+    @app_commands.describe(lobby_name="Hash value of the lobby. Can be found under 'my lobbies'",
+                           channel="Channel to post the digest in. Leave empty to turn the digest off.")
+    async def digest(self, interaction: Interaction, lobby_name: str, channel: Optional[TextChannel] = None):
+        user_id = str(interaction.user.id)
+        guild_id = str(interaction.guild_id) if interaction.guild_id is not None else None
+        channel_id = str(channel.id) if channel is not None else None
+        if channel is not None and guild_id is None:
+            await interaction.response.send_message("Digests can only be set up inside a server.", ephemeral=True)
+            return
+
+        result = await self.db.set_digest(lobby_name, user_id, guild_id, channel_id, interaction.created_at)
+        match result:
+            case DatabaseEnums.SUCCESS:
+                if channel is None:
+                    await interaction.response.send_message(f"Weekly digest of **{lobby_name}** turned off.", ephemeral=True)
+                else:
+                    await interaction.response.send_message(f"Weekly digest of **{lobby_name}** will be posted in {channel.mention}.", ephemeral=True)
+            case DatabaseEnums.INVALID_LOBBY:
+                await interaction.response.send_message(f"Invalid lobby name: **{lobby_name}**", ephemeral=True)
+            case DatabaseEnums.INSUFFICIENT_PRIVILAGES:
+                await interaction.response.send_message(f"You need to be an admin of **{lobby_name}** to set up its digest.", ephemeral=True)
+            case _:
+                await interaction.response.send_message(f"Something unexpected happened.", ephemeral=True)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Digests(bot, bot.db))
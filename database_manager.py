@@ -1,9 +1,15 @@
 import enum
 import datetime
 import os
+import uuid
+from collections import OrderedDict
 from security_manager import SecurityManager
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 import aiosqlite
+import numpy as np
+import study_analytics
+from season_scheduler import SEASON_PERIODS, next_season_reset
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 
 class DatabaseEnums(enum.IntEnum):
@@ -19,25 +25,147 @@ class DatabaseEnums(enum.IntEnum):
     INVALID_LOBBY = 38
     CHRONO_ALREADY_RUNNING = 39
     CHRONO_ALREADY_NOT_RUNNING = 40
+    INVALID_SCHEDULE = 41
+    INVALID_SEASON = 42
+
+
+class BulkParams(list):
+    """Parameter rows of one _transaction statement, sent with a single executemany() call."""
 
 
 class DatabaseManager:
     DB_FILE = os.path.join(os.path.dirname(
         os.path.abspath(__file__)), "lobbies.db")
     _security = SecurityManager()
+    # Weekly digests are spread over this many seconds after Monday 00:00 UTC
+    DIGEST_WINDOW_SECONDS = 6 * 3600
+    # Least recently used entries are evicted past this size, it also bounds the warm snapshot
+    STATS_CACHE_SIZE = 2048
+
+    def __init__(self) -> None:
+        # Bumped whenever a lobby's standings change so rendered leaderboards can be cached.
+        # The generation keeps versions from a previous process from matching new ones.
+        self._generation = uuid.uuid4().hex[:8]
+        self._lobby_versions: Dict[str, int] = {}
+        # (lobby_hash, user_id) -> per-user part of get_user_stats, dropped on the user's next stop_chrono
+        self._stats_cache: OrderedDict[Tuple[str, str], Dict[str, Any]] = OrderedDict()
+        # (lobby_hash, user_id) -> last_entry of every running chronometer
+        self._running_chronos: Dict[Tuple[str, str], str] = {}
+        self._running_index_ready = False
+
+    async def get_lobby_version(self, lobby_name: str) -> str:
+        lobby_hash = self._security.generate_lobby_hash(lobby_name)
+        return f"{self._generation}-{self._lobby_versions.get(lobby_hash, 0)}"
 
-    async def initialize(self):
+    def _bump_lobby_version(self, lobby_hash: str):
+        self._lobby_versions[lobby_hash] = self._lobby_versions.get(
+            lobby_hash, 0) + 1
+
+    # Every query goes through the helpers below. Other storage backends
+    # (see sqlalchemy_database_manager.py) only need to override these.
+
+    async def _execute(self, query: str, params: Sequence[Any] = ()) -> int:
+        async with aiosqlite.connect(self.DB_FILE) as db:
+            cursor = await db.execute(query, params)
+            await db.commit()
+            return cursor.rowcount
+
+    async def _transaction(self, statements: List[Tuple[str, Sequence[Any]]]) -> List[int]:
+        '''
+        Runs the statements in one transaction and returns the rowcount of each.
+        '''
+        rowcounts = []
         async with aiosqlite.connect(self.DB_FILE) as db:
-            await db.execute('''
+            for query, params in statements:
+                if isinstance(params, BulkParams):
+                    if not params:
+                        rowcounts.append(0)
+                        continue
+                    cursor = await db.executemany(query, params)
+                else:
+                    cursor = await db.execute(query, params)
+                rowcounts.append(cursor.rowcount)
+            await db.commit()
+        return rowcounts
+
+    async def _fetchone(self, query: str, params: Sequence[Any] = ()) -> Optional[Dict[str, Any]]:
+        async with aiosqlite.connect(self.DB_FILE) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute(query, params)
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
+    async def _fetchall(self, query: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        async with aiosqlite.connect(self.DB_FILE) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute(query, params)
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+    async def close(self):
+        pass
+
+    async def build_running_chrono_index(self):
+        self._running_chronos.clear()
+        lobby_tables = await self._fetchall("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'lobby_%'")
+        for table in lobby_tables:
+            lobby_hash = table["name"].removeprefix("lobby_")
+            rows = await self._fetchall(f'SELECT user_id, last_entry FROM "{table["name"]}" WHERE is_running')
+            for row in rows:
+                self._running_chronos[(lobby_hash, row["user_id"])] = row["last_entry"]
+        self._running_index_ready = True
+        print(f"Indexed {len(self._running_chronos)} running chronometers.")
+
+    def _db_file_signature(self) -> Optional[List[int]]:
+        try:
+            stat = os.stat(self.DB_FILE)
+        except FileNotFoundError:
+            return None
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def export_warm_state(self) -> Dict[str, Any]:
+        '''
+        In-memory state worth keeping across a restart. Only valid while the
+        database file is untouched, so call it after the last write.
+        '''
+        return {
+            "db_file_signature": self._db_file_signature(),
+            "generation": self._generation,
+            "lobby_versions": self._lobby_versions,
+            "stats_cache": [[h, u, stats] for (h, u), stats in self._stats_cache.items()],
+            "running_chronos": [[h, u, entry] for (h, u), entry in self._running_chronos.items()],
+        }
+
+    def import_warm_state(self, state: Optional[Dict[str, Any]]) -> bool:
+        '''
+        Returns False if the state is missing or the database changed since it was exported.
+        '''
+        if not state or state.get("db_file_signature") != self._db_file_signature():
+            return False
+        self._generation = state["generation"]
+        self._lobby_versions = dict(state["lobby_versions"])
+        self._stats_cache = OrderedDict()
+        for h, u, stats in state["stats_cache"]:
+            self._cache_user_stats((h, u), stats)
+        self._running_chronos = {(h, u): entry for h, u, entry in state["running_chronos"]}
+        self._running_index_ready = True
+        print(f"Restored warm state: {len(self._lobby_versions)} lobby versions, " +
+              f"{len(self._running_chronos)} running chronometers.")
+        return True
+
+    async def initialize(self):
+        await self._transaction([
+            ('''
                 CREATE TABLE IF NOT EXISTS Lobbies (
                     hash TEXT PRIMARY KEY,
                     name TEXT NOT NULL,
                     is_public BOOLEAN,
-                    password_hash TEXT
+                    password_hash TEXT,
+                    season_id INTEGER DEFAULT 1,
+                    season_started_at INTEGER
                 )
-            ''')
-
-            await db.execute('''
+            ''', ()),
+            ('''
                 CREATE TABLE IF NOT EXISTS Users (
                     user_id TEXT PRIMARY KEY,
                     lobby_hash_1 TEXT,
@@ -51,10 +179,68 @@ class DatabaseManager:
                     lobby_hash_9 TEXT,
                     lobby_hash_10 TEXT
                 )
-            ''')
-
-            await db.commit()
-            print("Database initialized.")
+            ''', ()),
+            ('''
+                CREATE TABLE IF NOT EXISTS Sessions (
+                    lobby_hash TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    start_ts INTEGER NOT NULL,
+                    end_ts INTEGER NOT NULL
+                )
+            ''', ()),
+            ("CREATE INDEX IF NOT EXISTS idx_sessions_lobby_user ON Sessions (lobby_hash, user_id)", ()),
+            ('''
+                CREATE TABLE IF NOT EXISTS Seasons (
+                    lobby_hash TEXT NOT NULL,
+                    season_id INTEGER NOT NULL,
+                    started_at INTEGER,
+                    ended_at INTEGER NOT NULL,
+                    PRIMARY KEY (lobby_hash, season_id)
+                )
+            ''', ()),
+            ('''
+                CREATE TABLE IF NOT EXISTS SeasonStandings (
+                    lobby_hash TEXT NOT NULL,
+                    season_id INTEGER NOT NULL,
+                    user_id TEXT NOT NULL,
+                    total_seconds INTEGER NOT NULL,
+                    PRIMARY KEY (lobby_hash, season_id, user_id)
+                )
+            ''', ()),
+            ('''
+                CREATE TABLE IF NOT EXISTS SeasonSchedules (
+                    lobby_hash TEXT PRIMARY KEY,
+                    period TEXT NOT NULL,
+                    timezone TEXT NOT NULL,
+                    next_reset_ts INTEGER NOT NULL
+                )
+            ''', ()),
+            ("CREATE INDEX IF NOT EXISTS idx_season_schedules_next ON SeasonSchedules (next_reset_ts)", ()),
+            ('''
+                CREATE TABLE IF NOT EXISTS Digests (
+                    lobby_hash TEXT PRIMARY KEY,
+                    guild_id TEXT NOT NULL,
+                    channel_id TEXT NOT NULL,
+                    last_sent_ts INTEGER,
+                    next_due_ts INTEGER NOT NULL
+                )
+            ''', ()),
+            ("CREATE INDEX IF NOT EXISTS idx_digests_next ON Digests (next_due_ts)", ()),
+        ])
+
+        # Databases created before seasons existed
+        await self._add_column_if_missing("Lobbies", "season_id", "INTEGER DEFAULT 1")
+        await self._add_column_if_missing("Lobbies", "season_started_at", "INTEGER")
+        lobby_tables = await self._fetchall("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'lobby_%'")
+        for table in lobby_tables:
+            await self._add_column_if_missing(table["name"], "season_id", "INTEGER DEFAULT 1")
+        print("Database initialized.")
+
+    async def _add_column_if_missing(self, table_name: str, column: str, definition: str):
+        columns = await self._fetchall(f'PRAGMA table_info("{table_name}")')
+        if not any(c["name"] == column for c in columns):
+            await self._execute(f'ALTER TABLE "{table_name}" ADD COLUMN {column} {definition}')
+            print(f"Added column {column} to {table_name}")
 
     async def create_lobby(self, user_id: str, name: str, is_public: bool = False, password: Optional[str] = None) -> int:
         '''
@@ -77,25 +263,21 @@ class DatabaseManager:
         lobby_hash = self._security.generate_lobby_hash(name)
         table_name = f"lobby_{lobby_hash}"
 
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            async with db.cursor() as cursor:
-                await cursor.execute(
-                    "INSERT INTO Lobbies (hash, name, is_public, password_hash) VALUES (?, ?, ?, ?)",
-                    (lobby_hash, name, is_public, password_hash)
+        await self._transaction([
+            ("INSERT INTO Lobbies (hash, name, is_public, password_hash) VALUES (?, ?, ?, ?)",
+             (lobby_hash, name, is_public, password_hash)),
+            (f'''
+                CREATE TABLE "{table_name}" (
+                    user_id TEXT(20) PRIMARY KEY,
+                    total_seconds INTEGER DEFAULT 0,
+                    is_admin BOOLEAN DEFAULT FALSE,
+                    is_running BOOLEAN DEFAULT FALSE,
+                    last_entry TEXT,
+                    season_id INTEGER DEFAULT 1
                 )
-
-                await cursor.execute(f'''
-                    CREATE TABLE "{table_name}" (
-                        user_id TEXT(20) PRIMARY KEY,
-                        total_seconds INTEGER DEFAULT 0,
-                        is_admin BOOLEAN DEFAULT FALSE,
-                        is_running BOOLEAN DEFAULT FALSE,
-                        last_entry TEXT
-                    )
-                ''')
-
-            await db.commit()
-            await self.add_user_to_lobby(name, "admin", user_id, is_admin=True)
+            ''', ()),
+        ])
+        await self.add_user_to_lobby(name, "admin", user_id, is_admin=True)
 
         print(f"Successfully created lobby '{name}' with hash: {lobby_hash}")
         return DatabaseEnums.SUCCESS
@@ -104,18 +286,14 @@ class DatabaseManager:
         if lobby_hash is None:
             lobby_hash = self._security.generate_lobby_hash(lobby_name)
         table_name = f"lobby_{lobby_hash}"
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            cursor = await db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-            result = await cursor.fetchone()
-            return result is not None
+        result = await self._fetchone("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+        return result is not None
 
     async def _lobby_exists(self, lobby_name: str, lobby_hash: str | None = None) -> bool:
         if lobby_hash is None:
             lobby_hash = self._security.generate_lobby_hash(lobby_name)
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            cursor = await db.execute("SELECT 1 FROM Lobbies WHERE hash=?", (lobby_hash,))
-            result = await cursor.fetchone()
-            return result is not None
+        result = await self._fetchone("SELECT 1 FROM Lobbies WHERE hash=?", (lobby_hash,))
+        return result is not None
 
     async def _check_lobby_all(self, lobby_name: str, lobby_hash: str | None = None) -> bool:
         '''
@@ -131,10 +309,8 @@ class DatabaseManager:
         lobby_hash = self._security.generate_lobby_hash(lobby_name)
         if not await self._check_lobby_all(lobby_hash):
             return False
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            cursor = await db.execute("SELECT is_public FROM Lobbies WHERE hash=?", (lobby_hash,))
-            result = await cursor.fetchone()
-            return bool(result[0]) if result else False
+        result = await self._fetchone("SELECT is_public FROM Lobbies WHERE hash=?", (lobby_hash,))
+        return bool(result["is_public"]) if result else False
 
     async def is_admin(self, user_id: str, lobby_name: str) -> bool:
         lobby_hash = self._security.generate_lobby_hash(lobby_name)
@@ -143,11 +319,9 @@ class DatabaseManager:
 
         table_name = f"lobby_{lobby_hash}"
         effective_user_id = user_id
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            query = f'SELECT is_admin FROM "{table_name}" WHERE user_id = ?'
-            cursor = await db.execute(query, (effective_user_id,))
-            result = await cursor.fetchone()
-            return bool(result[0]) if result else False
+        query = f'SELECT is_admin FROM "{table_name}" WHERE user_id = ?'
+        result = await self._fetchone(query, (effective_user_id,))
+        return bool(result["is_admin"]) if result else False
 
     async def user_has_free_slots(self, user_id: str) -> bool:
         user_has_room = await self._add_lobby_to_user_table(user_id, "temporary")
@@ -171,25 +345,24 @@ class DatabaseManager:
         table_name = f"lobby_{lobby_hash}"
         effective_user_id = user_id_to_add
 
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            query = f'SELECT 1 FROM "{table_name}" WHERE user_id = ?'
-            cursor = await db.execute(query, (effective_user_id,))
-            result = await cursor.fetchone()
-
-            if not result:
-                user_has_empty_slots = await self._add_lobby_to_user_table(
-                    user_id_to_add, lobby_name)
-                if not user_has_empty_slots:
-                    return DatabaseEnums.USER_HAS_NO_FREE_SLOTS
-                insert_query = f'INSERT INTO "{table_name}" (user_id, is_admin, is_running, last_entry) VALUES (?, ?, ?, ?)'
-                await db.execute(insert_query, (effective_user_id, is_admin, False, None))
-                await db.commit()
-                print(f"Added user {user_id_to_add} to lobby {lobby_hash}")
-                return DatabaseEnums.SUCCESS
-            else:
-                print(
-                    f"User {user_id_to_add} already exists in lobby {lobby_hash}")
-                return DatabaseEnums.USER_ALREADY_EXISTS_IN_LOBBY
+        query = f'SELECT 1 FROM "{table_name}" WHERE user_id = ?'
+        result = await self._fetchone(query, (effective_user_id,))
+
+        if not result:
+            user_has_empty_slots = await self._add_lobby_to_user_table(
+                user_id_to_add, lobby_name)
+            if not user_has_empty_slots:
+                return DatabaseEnums.USER_HAS_NO_FREE_SLOTS
+            season_id = await self._get_season_id(lobby_hash)
+            insert_query = f'INSERT INTO "{table_name}" (user_id, is_admin, is_running, last_entry, season_id) VALUES (?, ?, ?, ?, ?)'
+            await self._execute(insert_query, (effective_user_id, is_admin, False, None, season_id))
+            self._bump_lobby_version(lobby_hash)
+            print(f"Added user {user_id_to_add} to lobby {lobby_hash}")
+            return DatabaseEnums.SUCCESS
+        else:
+            print(
+                f"User {user_id_to_add} already exists in lobby {lobby_hash}")
+            return DatabaseEnums.USER_ALREADY_EXISTS_IN_LOBBY
 
     async def join_lobby(self, lobby_name: str, user_id: str, password: str | None) -> int:
         '''
@@ -238,25 +411,26 @@ class DatabaseManager:
         table_name = f"lobby_{lobby_hash}"
         effective_user_id = user_id_to_remove
 
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            removed_lobby_from_user = await self._remove_lobby_from_user_table(
-                user_id_to_remove, lobby_name)
+        removed_lobby_from_user = await self._remove_lobby_from_user_table(
+            user_id_to_remove, lobby_name)
 
-            if not removed_lobby_from_user:
-                return DatabaseEnums.USER_NOT_IN_LOBBY
+        if not removed_lobby_from_user:
+            return DatabaseEnums.USER_NOT_IN_LOBBY
 
-            delete_query = f'DELETE FROM "{table_name}" WHERE user_id = ?'
-            cursor = await db.execute(delete_query, (effective_user_id,))
-            await db.commit()
+        delete_query = f'DELETE FROM "{table_name}" WHERE user_id = ?'
+        rowcount = await self._execute(delete_query, (effective_user_id,))
 
-            if cursor.rowcount > 0:
-                print(
-                    f"Successfully removed user {user_id_to_remove} from lobby {lobby_hash}")
-                return DatabaseEnums.SUCCESS
-            else:
-                print(
-                    f"User {user_id_to_remove} not found in lobby {lobby_hash}")
-                return DatabaseEnums.USER_NOT_IN_LOBBY
+        if rowcount > 0:
+            self._bump_lobby_version(lobby_hash)
+            self._stats_cache.pop((lobby_hash, effective_user_id), None)
+            self._running_chronos.pop((lobby_hash, effective_user_id), None)
+            print(
+                f"Successfully removed user {user_id_to_remove} from lobby {lobby_hash}")
+            return DatabaseEnums.SUCCESS
+        else:
+            print(
+                f"User {user_id_to_remove} not found in lobby {lobby_hash}")
+            return DatabaseEnums.USER_NOT_IN_LOBBY
 
     async def _get_lobby_name(self, lobby_hash: str) -> Optional[str]:
 
@@ -264,20 +438,16 @@ class DatabaseManager:
         if not lobby_exists:
             return None
 
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            cursor = await db.execute("SELECT name FROM Lobbies WHERE hash = ?", (lobby_hash,))
-            result = await cursor.fetchone()
-            return result[0] if result else None
+        result = await self._fetchone("SELECT name FROM Lobbies WHERE hash = ?", (lobby_hash,))
+        return result["name"] if result else None
 
     async def _get_lobby_password_hash(self, lobby_name: str) -> Optional[str]:
         lobby_hash = self._security.generate_lobby_hash(lobby_name)
         lobby_exists = await self._check_lobby_all(lobby_name)
         if not lobby_exists:
             return None
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            cursor = await db.execute("SELECT password_hash FROM Lobbies WHERE hash = ?", (lobby_hash,))
-            result = await cursor.fetchone()
-            return result[0] if result else None
+        result = await self._fetchone("SELECT password_hash FROM Lobbies WHERE hash = ?", (lobby_hash,))
+        return result["password_hash"] if result else None
 
     async def delete_lobby(self, user_id_dropper: str, lobby_name: str) -> int:
         '''
@@ -294,13 +464,22 @@ class DatabaseManager:
             return DatabaseEnums.INSUFFICIENT_PRIVILAGES
 
         table_name = f"lobby_{lobby_hash}"
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            await db.execute("DELETE FROM Lobbies WHERE hash = ?", (lobby_hash,))
-            drop_query = f'DROP TABLE IF EXISTS "{table_name}"'
-            await db.execute(drop_query)
-            await db.commit()
-            print(f"Successfully deleted lobby with hash: {lobby_hash}")
-            return DatabaseEnums.SUCCESS
+        await self._transaction([
+            ("DELETE FROM Lobbies WHERE hash = ?", (lobby_hash,)),
+            ("DELETE FROM Sessions WHERE lobby_hash = ?", (lobby_hash,)),
+            ("DELETE FROM Seasons WHERE lobby_hash = ?", (lobby_hash,)),
+            ("DELETE FROM SeasonStandings WHERE lobby_hash = ?", (lobby_hash,)),
+            ("DELETE FROM SeasonSchedules WHERE lobby_hash = ?", (lobby_hash,)),
+            ("DELETE FROM Digests WHERE lobby_hash = ?", (lobby_hash,)),
+            (f'DROP TABLE IF EXISTS "{table_name}"', ()),
+        ])
+        self._bump_lobby_version(lobby_hash)
+        for key in [key for key in self._stats_cache if key[0] == lobby_hash]:
+            del self._stats_cache[key]
+        self._running_chronos = {
+            key: entry for key, entry in self._running_chronos.items() if key[0] != lobby_hash}
+        print(f"Successfully deleted lobby with hash: {lobby_hash}")
+        return DatabaseEnums.SUCCESS
 
     async def get_lobby_users(self, lobby_name: str) -> List[Dict[str, Any]]:
         lobby_hash = self._security.generate_lobby_hash(lobby_name)
@@ -309,103 +488,91 @@ class DatabaseManager:
         if not lobby_exists:
             return []
 
-        table_name = f"lobby_{lobby_hash}"
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            db.row_factory = aiosqlite.Row
-            query = f'SELECT * FROM "{table_name}"'
-            cursor = await db.execute(query)
-            rows = await cursor.fetchall()
-            entries = [dict(row) for row in rows]
+        return await self._get_current_standings(lobby_hash)
 
-            return list(entries)
+    async def _get_current_standings(self, lobby_hash: str) -> List[Dict[str, Any]]:
+        # Rows last written in an older season count as zero, this is what makes a season reset O(1)
+        season_id = await self._get_season_id(lobby_hash)
+        table_name = f"lobby_{lobby_hash}"
+        query = f'''
+            SELECT user_id, CASE WHEN season_id = ? THEN total_seconds ELSE 0 END AS total_seconds,
+                   is_admin, is_running, last_entry, season_id
+            FROM "{table_name}"
+        '''
+        return await self._fetchall(query, (season_id,))
 
     async def _register_user_if_not_exists(self, user_id: str):
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            await db.execute("INSERT OR IGNORE INTO Users (user_id) VALUES (?)", (user_id,))
-            await db.commit()
+        await self._execute("INSERT OR IGNORE INTO Users (user_id) VALUES (?)", (user_id,))
 
     async def _add_lobby_to_user_table(self, user_id: str, lobby_name: str) -> bool:
         lobby_hash = self._security.generate_lobby_hash(lobby_name)
         await self._register_user_if_not_exists(user_id)
 
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("SELECT * FROM Users WHERE user_id = ?", (user_id,))
-            user_row = await cursor.fetchone()
-
-            if user_row:
-                first_empty_slot = None
-                for i in range(1, 11):
-                    slot_name = f"lobby_hash_{i}"
-                    if user_row[slot_name] is None:
-                        first_empty_slot = slot_name
-                        break
-
-                if first_empty_slot:
-                    update_query = f'UPDATE Users SET {first_empty_slot} = ? WHERE user_id = ?'
-                    await db.execute(update_query, (lobby_hash, user_id))
-                    await db.commit()
-                    print(
-                        f"Added lobby {lobby_hash} to {first_empty_slot} for user {user_id}.")
-                    return True
-                else:
-                    print(f"User {user_id} has no empty lobby slots.")
-                    return False
+        user_row = await self._fetchone("SELECT * FROM Users WHERE user_id = ?", (user_id,))
+
+        if user_row:
+            first_empty_slot = None
+            for i in range(1, 11):
+                slot_name = f"lobby_hash_{i}"
+                if user_row[slot_name] is None:
+                    first_empty_slot = slot_name
+                    break
+
+            if first_empty_slot:
+                update_query = f'UPDATE Users SET {first_empty_slot} = ? WHERE user_id = ?'
+                await self._execute(update_query, (lobby_hash, user_id))
+                print(
+                    f"Added lobby {lobby_hash} to {first_empty_slot} for user {user_id}.")
+                return True
+            else:
+                print(f"User {user_id} has no empty lobby slots.")
+                return False
         return False
 
     async def _remove_lobby_from_user_table(self, user_id: str, lobby_name: str) -> bool:
         lobby_hash = self._security.generate_lobby_hash(lobby_name)
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("SELECT * FROM Users WHERE user_id = ?", (user_id,))
-            user_row = await cursor.fetchone()
-
-            if user_row:
-                slot_to_clear = None
-                for i in range(1, 11):
-                    slot_name = f"lobby_hash_{i}"
-                    if user_row[slot_name] == lobby_hash:
-                        slot_to_clear = slot_name
-                        break
-
-                if slot_to_clear:
-                    update_query = f'UPDATE Users SET {slot_to_clear} = NULL WHERE user_id = ?'
-                    await db.execute(update_query, (user_id,))
-                    await db.commit()
-                    print(
-                        f"Removed lobby {lobby_hash} from {slot_to_clear} for user {user_id}.")
-                    return True
-                else:
-                    print(
-                        f"Lobby {lobby_hash} not found in any slots for user {user_id}.")
-                    return False
+        user_row = await self._fetchone("SELECT * FROM Users WHERE user_id = ?", (user_id,))
+
+        if user_row:
+            slot_to_clear = None
+            for i in range(1, 11):
+                slot_name = f"lobby_hash_{i}"
+                if user_row[slot_name] == lobby_hash:
+                    slot_to_clear = slot_name
+                    break
+
+            if slot_to_clear:
+                update_query = f'UPDATE Users SET {slot_to_clear} = NULL WHERE user_id = ?'
+                await self._execute(update_query, (user_id,))
+                print(
+                    f"Removed lobby {lobby_hash} from {slot_to_clear} for user {user_id}.")
+                return True
+            else:
+                print(
+                    f"Lobby {lobby_hash} not found in any slots for user {user_id}.")
+                return False
         return False
 
     async def get_user_lobbies(self, user_id: str) -> List[str]:
         await self._register_user_if_not_exists(user_id)
 
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("SELECT * FROM Users WHERE user_id = ?", (user_id,))
-            user_row = await cursor.fetchone()
-
-            lobbies = []
-            if user_row:
-                for i in range(1, 11):
-                    slot_name = f"lobby_hash_{i}"
-                    lobby_hash = user_row[slot_name]
-                    if lobby_hash is not None:
-                        lobbies.append(lobby_hash)
-            return lobbies
+        user_row = await self._fetchone("SELECT * FROM Users WHERE user_id = ?", (user_id,))
+
+        lobbies = []
+        if user_row:
+            for i in range(1, 11):
+                slot_name = f"lobby_hash_{i}"
+                lobby_hash = user_row[slot_name]
+                if lobby_hash is not None:
+                    lobbies.append(lobby_hash)
+        return lobbies
 
     async def _is_in_lobby(self, user_id: str, lobby_name: str) -> bool:
         lobby_hash = self._security.generate_lobby_hash(lobby_name)
         table_name = f"lobby_{lobby_hash}"
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            query = f'SELECT 1 FROM "{table_name}" WHERE user_id = ?'
-            cursor = await db.execute(query, (user_id,))
-            result = await cursor.fetchone()
-            return result is not None
+        query = f'SELECT 1 FROM "{table_name}" WHERE user_id = ?'
+        result = await self._fetchone(query, (user_id,))
+        return result is not None
 
     async def start_chrono(self, lobby_name: str, user_id: str, time: datetime.datetime) -> int:
         '''
@@ -417,19 +584,19 @@ class DatabaseManager:
         elif not await self._is_in_lobby(user_id, lobby_name):
             return DatabaseEnums.USER_NOT_IN_LOBBY
 
+        if self._running_index_ready and (lobby_hash, user_id) in self._running_chronos:
+            return DatabaseEnums.CHRONO_ALREADY_RUNNING
+
         table_name = f"lobby_{lobby_hash}"
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(f'SELECT is_running FROM "{table_name}" WHERE user_id = ?', (user_id,))
-            result = await cursor.fetchone()
+        result = await self._fetchone(f'SELECT is_running FROM "{table_name}" WHERE user_id = ?', (user_id,))
 
-            if result and result['is_running']:
-                return DatabaseEnums.CHRONO_ALREADY_RUNNING
+        if result and result['is_running']:
+            return DatabaseEnums.CHRONO_ALREADY_RUNNING
 
-            update_query = f'UPDATE "{table_name}" SET is_running = ?, last_entry = ? WHERE user_id = ?'
-            await db.execute(update_query, (True, time.isoformat(), user_id))
-            await db.commit()
-            return DatabaseEnums.SUCCESS
+        update_query = f'UPDATE "{table_name}" SET is_running = ?, last_entry = ? WHERE user_id = ?'
+        await self._execute(update_query, (True, time.isoformat(), user_id))
+        self._running_chronos[(lobby_hash, user_id)] = time.isoformat()
+        return DatabaseEnums.SUCCESS
 
     async def stop_chrono(self, lobby_name: str, user_id: str, time: datetime.datetime) -> tuple[int, int]:
         '''
@@ -441,22 +608,354 @@ class DatabaseManager:
         elif not await self._is_in_lobby(user_id, lobby_name):
             return (DatabaseEnums.USER_NOT_IN_LOBBY, 0)
 
+        # The index is complete, so a miss means there is nothing to stop
+        if self._running_index_ready and (lobby_hash, user_id) not in self._running_chronos:
+            return (DatabaseEnums.CHRONO_ALREADY_NOT_RUNNING, 0)
+
         table_name = f"lobby_{lobby_hash}"
-        async with aiosqlite.connect(self.DB_FILE) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(f'SELECT is_running, last_entry, total_seconds FROM "{table_name}" WHERE user_id = ?', (user_id,))
-            user_row = await cursor.fetchone()
+        user_row = await self._fetchone(f'SELECT is_running, last_entry, total_seconds, season_id FROM "{table_name}" WHERE user_id = ?', (user_id,))
+
+        if not user_row or not user_row['is_running'] or user_row['last_entry'] is None:
+            self._running_chronos.pop((lobby_hash, user_id), None)
+            return (DatabaseEnums.CHRONO_ALREADY_NOT_RUNNING, 0)
+
+        last_entry_time = datetime.datetime.fromisoformat(
+            user_row['last_entry'])
+        time_difference = time - last_entry_time
+        seconds_to_add = int(time_difference.total_seconds())
+        stop_ts = int(time.timestamp())
+
+        # The season is read when the row is written, so a reset committed after the read above still
+        # counts. Time before season_started_at was already credited to the archived season.
+        # The last_entry check makes this a compare-and-set against a concurrent stop or reset.
+        update_query = f'''
+            UPDATE "{table_name}" SET is_running = 0, last_entry = NULL,
+                total_seconds = (CASE WHEN season_id = (SELECT COALESCE(season_id, 1) FROM Lobbies WHERE hash = ?) THEN total_seconds ELSE 0 END)
+                    + MAX(MIN(?, ? - COALESCE((SELECT season_started_at FROM Lobbies WHERE hash = ?), 0)), 0),
+                season_id = (SELECT COALESCE(season_id, 1) FROM Lobbies WHERE hash = ?)
+            WHERE user_id = ? AND is_running AND last_entry = ?
+        '''
+        rowcounts = await self._transaction([
+            (update_query, (lobby_hash, seconds_to_add, stop_ts, lobby_hash, lobby_hash, user_id, user_row['last_entry'])),
+            ("INSERT INTO Sessions (lobby_hash, user_id, start_ts, end_ts) SELECT ?, ?, ?, ? WHERE changes() > 0",
+             (lobby_hash, user_id, int(last_entry_time.timestamp()), stop_ts)),
+        ])
+        if rowcounts[0] == 0:
+            self._running_chronos.pop((lobby_hash, user_id), None)
+            return (DatabaseEnums.CHRONO_ALREADY_NOT_RUNNING, 0)
+
+        self._bump_lobby_version(lobby_hash)
+        self._stats_cache.pop((lobby_hash, user_id), None)
+        self._running_chronos.pop((lobby_hash, user_id), None)
+        return (DatabaseEnums.SUCCESS, seconds_to_add)
+
+    async def get_user_stats(self, lobby_name: str, user_id: str, time: datetime.datetime) -> tuple[int, Dict[str, Any]]:
+        '''
+        Returns SUCCESS, INVALID_LOBBY, USER_NOT_IN_LOBBY
+        '''
+        lobby_hash = self._security.generate_lobby_hash(lobby_name)
+        if not await self._lobby_exists(lobby_name):
+            return (DatabaseEnums.INVALID_LOBBY, {})
+        elif not await self._is_in_lobby(user_id, lobby_name):
+            return (DatabaseEnums.USER_NOT_IN_LOBBY, {})
 
-            if not user_row or not user_row['is_running'] or user_row['last_entry'] is None:
-                return (DatabaseEnums.CHRONO_ALREADY_NOT_RUNNING, 0)
+        user_stats = self._stats_cache.get((lobby_hash, user_id))
+        if user_stats is None:
+            user_stats = await self._compute_user_stats(lobby_hash, user_id)
+            self._cache_user_stats((lobby_hash, user_id), user_stats)
+        else:
+            self._stats_cache.move_to_end((lobby_hash, user_id))
+
+        # Other members keep studying, so the lobby comparison is never cached
+        rows = await self._get_current_standings(lobby_hash)
+        totals = np.fromiter((row["total_seconds"] for row in rows),
+                             dtype=np.int64, count=len(rows))
+        user_total = next(row["total_seconds"]
+                          for row in rows if row["user_id"] == user_id)
+
+        today = int(time.timestamp()) // 86400
+        last_study_day = user_stats["last_study_day"]
+        current_streak = user_stats["trailing_streak"] if last_study_day is not None and last_study_day >= today - 1 else 0
+
+        stats = dict(user_stats)
+        stats.update({
+            "total_seconds": user_total,
+            "percentile": study_analytics.percentile_rank(totals, user_total),
+            "lobby_median_seconds": float(np.median(totals)) if totals.size else 0.0,
+            "current_streak": current_streak,
+        })
+        return (DatabaseEnums.SUCCESS, stats)
+
+    def _cache_user_stats(self, key: Tuple[str, str], user_stats: Dict[str, Any]):
+        self._stats_cache[key] = user_stats
+        self._stats_cache.move_to_end(key)
+        while len(self._stats_cache) > self.STATS_CACHE_SIZE:
+            self._stats_cache.popitem(last=False)
+
+    async def _compute_user_stats(self, lobby_hash: str, user_id: str) -> Dict[str, Any]:
+        rows = await self._fetchall("SELECT start_ts, end_ts FROM Sessions WHERE lobby_hash = ? AND user_id = ?",
+                                    (lobby_hash, user_id))
+        starts = np.fromiter((row["start_ts"] for row in rows),
+                             dtype=np.int64, count=len(rows))
+        ends = np.fromiter((row["end_ts"] for row in rows),
+                           dtype=np.int64, count=len(rows))
+
+        heatmap = study_analytics.weekly_heatmap(starts, ends)
+        days = study_analytics.study_days(starts, ends)
+        longest_streak, trailing_streak = study_analytics.streaks(days)
+        return {
+            "session_count": len(rows),
+            "heatmap": heatmap.tolist(),
+            "busiest_hour": int(heatmap.sum(axis=0).argmax()) if heatmap.any() else None,
+            "busiest_weekday": int(heatmap.sum(axis=1).argmax()) if heatmap.any() else None,
+            "longest_streak": longest_streak,
+            "trailing_streak": trailing_streak,
+            "last_study_day": int(days[-1]) if days.size else None,
+        }
+
+    async def _get_season_id(self, lobby_hash: str) -> int:
+        result = await self._fetchone("SELECT season_id FROM Lobbies WHERE hash = ?", (lobby_hash,))
+        return (result["season_id"] or 1) if result else 1
+
+    async def get_current_season(self, lobby_name: str) -> int:
+        lobby_hash = self._security.generate_lobby_hash(lobby_name)
+        return await self._get_season_id(lobby_hash)
 
-            last_entry_time = datetime.datetime.fromisoformat(
-                user_row['last_entry'])
-            time_difference = time - last_entry_time
-            seconds_to_add = int(time_difference.total_seconds())
-            new_total_seconds = user_row['total_seconds'] + seconds_to_add
+    def _archive_season_statements(self, lobby_hash: str, time: datetime.datetime) -> List[Tuple[str, Sequence[Any]]]:
+        '''
+        Statements that archive the current season and start the next one. They read everything
+        they need themselves, so a chronometer stopped concurrently is counted exactly once.
+        '''
+        reset_ts = int(time.timestamp())
+        table_name = f"lobby_{lobby_hash}"
+        current_season = "(SELECT COALESCE(season_id, 1) FROM Lobbies WHERE hash = ?)"
+        # Sessions stopped after reset_ts but before this runs (a scheduled reset running late) were
+        # credited to the ending season, this is their part that belongs to the next one
+        after_reset = f'''(
+            SELECT SUM(end_ts - MAX(start_ts, ?)) FROM Sessions
+            WHERE Sessions.lobby_hash = ? AND Sessions.user_id = "{table_name}".user_id AND end_ts > ?
+        )'''
+        counted_from = "MAX(CAST(strftime('%s', last_entry) AS INTEGER), COALESCE(Lobbies.season_started_at, 0))"
+        return [
+            (f'''
+                INSERT OR REPLACE INTO SeasonStandings (lobby_hash, season_id, user_id, total_seconds)
+                SELECT ?, season_id, user_id, total_seconds - COALESCE({after_reset}, 0) FROM "{table_name}"
+                WHERE season_id = {current_season}
+            ''', (lobby_hash, reset_ts, lobby_hash, reset_ts, lobby_hash)),
+            # Running chronometers are only added to total_seconds when stopped, so the part
+            # of them that falls into the ending season is credited to it here
+            (f'''
+                INSERT INTO SeasonStandings (lobby_hash, season_id, user_id, total_seconds)
+                SELECT Lobbies.hash, COALESCE(Lobbies.season_id, 1), user_id, ? - {counted_from}
+                FROM "{table_name}" JOIN Lobbies ON Lobbies.hash = ?
+                WHERE is_running AND last_entry IS NOT NULL AND ? > {counted_from}
+                ON CONFLICT(lobby_hash, season_id, user_id) DO UPDATE SET total_seconds = total_seconds + excluded.total_seconds
+            ''', (reset_ts, lobby_hash, reset_ts)),
+            (f'''
+                UPDATE "{table_name}" SET total_seconds = COALESCE({after_reset}, 0), season_id = season_id + 1
+                WHERE season_id = {current_season}
+            ''', (reset_ts, lobby_hash, reset_ts, lobby_hash)),
+            ("""
+                INSERT OR REPLACE INTO Seasons (lobby_hash, season_id, started_at, ended_at)
+                SELECT hash, COALESCE(season_id, 1), season_started_at, ? FROM Lobbies WHERE hash = ?
+            """, (reset_ts, lobby_hash)),
+            ("UPDATE Lobbies SET season_id = COALESCE(season_id, 1) + 1, season_started_at = ? WHERE hash = ?",
+             (reset_ts, lobby_hash)),
+        ]
+
+    async def _archive_season(self, lobby_hash: str, time: datetime.datetime) -> int:
+        await self._transaction(self._archive_season_statements(lobby_hash, time))
+        self._bump_lobby_version(lobby_hash)
+        season_id = await self._get_season_id(lobby_hash) - 1
+        print(f"Archived season {season_id} of lobby {lobby_hash}")
+        return season_id
+
+    async def reset_lobby(self, lobby_name: str, user_id_resetter: str, time: datetime.datetime) -> tuple[int, int]:
+        '''
+        Archives the current season and starts a new one.
+        Returns (INSUFFICIENT_PRIVILAGES, SUCCESS, INVALID_LOBBY; archived season id)
+        '''
+        lobby_hash = self._security.generate_lobby_hash(lobby_name)
+        if not await self._check_lobby_all(lobby_name):
+            return (DatabaseEnums.INVALID_LOBBY, 0)
+        if not await self.is_admin(user_id_resetter, lobby_name):
+            return (DatabaseEnums.INSUFFICIENT_PRIVILAGES, 0)
 
-            update_query = f'UPDATE "{table_name}" SET is_running = ?, last_entry = NULL, total_seconds = ? WHERE user_id = ?'
-            await db.execute(update_query, (False, new_total_seconds, user_id))
-            await db.commit()
-            return (DatabaseEnums.SUCCESS, seconds_to_add)
+        archived_season_id = await self._archive_season(lobby_hash, time)
+        return (DatabaseEnums.SUCCESS, archived_season_id)
+
+    async def get_season_standings(self, lobby_name: str, season_id: int) -> tuple[int, List[Dict[str, Any]]]:
+        '''
+        Returns (SUCCESS, INVALID_LOBBY, INVALID_SEASON; standings of an archived season)
+        '''
+        lobby_hash = self._security.generate_lobby_hash(lobby_name)
+        if not await self._check_lobby_all(lobby_name):
+            return (DatabaseEnums.INVALID_LOBBY, [])
+        season = await self._fetchone("SELECT 1 FROM Seasons WHERE lobby_hash = ? AND season_id = ?",
+                                      (lobby_hash, season_id))
+        if season is None:
+            return (DatabaseEnums.INVALID_SEASON, [])
+        standings = await self._fetchall("SELECT user_id, total_seconds FROM SeasonStandings WHERE lobby_hash = ? AND season_id = ?",
+                                         (lobby_hash, season_id))
+        return (DatabaseEnums.SUCCESS, standings)
+
+    async def set_season_schedule(self, lobby_name: str, user_id: str, period: str, timezone: str, time: datetime.datetime) -> int:
+        '''
+        period is one of SEASON_PERIODS or "off".
+        Returns INSUFFICIENT_PRIVILAGES, SUCCESS, INVALID_LOBBY, INVALID_SCHEDULE
+        '''
+        lobby_hash = self._security.generate_lobby_hash(lobby_name)
+        if not await self._check_lobby_all(lobby_name):
+            return DatabaseEnums.INVALID_LOBBY
+        if not await self.is_admin(user_id, lobby_name):
+            return DatabaseEnums.INSUFFICIENT_PRIVILAGES
+
+        if period == "off":
+            await self._execute("DELETE FROM SeasonSchedules WHERE lobby_hash = ?", (lobby_hash,))
+            return DatabaseEnums.SUCCESS
+        if period not in SEASON_PERIODS:
+            return DatabaseEnums.INVALID_SCHEDULE
+        try:
+            ZoneInfo(timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            return DatabaseEnums.INVALID_SCHEDULE
+
+        next_reset = next_season_reset(period, timezone, time)
+        await self._execute("INSERT OR REPLACE INTO SeasonSchedules (lobby_hash, period, timezone, next_reset_ts) VALUES (?, ?, ?, ?)",
+                            (lobby_hash, period, timezone, int(next_reset.timestamp())))
+        return DatabaseEnums.SUCCESS
+
+    async def run_due_season_resets(self, time: datetime.datetime) -> Optional[int]:
+        '''
+        Archives the season of every lobby whose scheduled reset is due.
+        Returns the timestamp of the next scheduled reset, if any.
+        '''
+        now_ts = int(time.timestamp())
+        due = await self._fetchall("SELECT lobby_hash, period, timezone, next_reset_ts FROM SeasonSchedules WHERE next_reset_ts <= ?",
+                                   (now_ts,))
+        # Every due lobby and the schedule updates commit together, a crash in between
+        # would otherwise archive a season again on the next run
+        statements: List[Tuple[str, Sequence[Any]]] = []
+        schedule_updates = BulkParams()
+        for schedule in due:
+            reset_time = datetime.datetime.fromtimestamp(
+                schedule["next_reset_ts"], datetime.timezone.utc)
+            statements += self._archive_season_statements(schedule["lobby_hash"], reset_time)
+            next_reset = next_season_reset(
+                schedule["period"], schedule["timezone"], max(reset_time, time))
+            schedule_updates.append((int(next_reset.timestamp()), schedule["lobby_hash"], schedule["next_reset_ts"]))
+        if due:
+            statements.append(("UPDATE SeasonSchedules SET next_reset_ts = ? WHERE lobby_hash = ? AND next_reset_ts = ?",
+                               schedule_updates))
+            await self._transaction(statements)
+            for schedule in due:
+                self._bump_lobby_version(schedule["lobby_hash"])
+            print(f"Archived the season of {len(due)} lobbies on schedule")
+
+        result = await self._fetchone("SELECT MIN(next_reset_ts) AS next_reset_ts FROM SeasonSchedules")
+        return result["next_reset_ts"] if result else None
+
+    async def get_top_lobby_users(self, lobby_name: str, start: datetime.datetime, end: datetime.datetime, limit: int = 10) -> List[Dict[str, Any]]:
+        '''
+        Current members ranked by the time of their finished sessions between start and end.
+        '''
+        lobby_hash = self._security.generate_lobby_hash(lobby_name)
+        if not await self._check_lobby_all(lobby_name):
+            return []
+        start_ts, end_ts = int(start.timestamp()), int(end.timestamp())
+        table_name = f"lobby_{lobby_hash}"
+        # Sessions crossing the window edges only count with their part inside it
+        query = f'''
+            SELECT user_id, SUM(MIN(end_ts, ?) - MAX(start_ts, ?)) AS total_seconds FROM Sessions
+            WHERE lobby_hash = ? AND end_ts > ? AND start_ts < ?
+                AND user_id IN (SELECT user_id FROM "{table_name}")
+            GROUP BY user_id ORDER BY total_seconds DESC LIMIT ?
+        '''
+        return await self._fetchall(query, (end_ts, start_ts, lobby_hash, start_ts, end_ts, limit))
+
+    def _next_digest_due(self, lobby_hash: str, after: datetime.datetime) -> int:
+        # A fixed per-lobby offset spreads thousands of digests over the window instead of one burst
+        offset = int(lobby_hash[:8], 16) % self.DIGEST_WINDOW_SECONDS
+        shifted = after - datetime.timedelta(seconds=offset)
+        week_start = next_season_reset("weekly", "UTC", shifted)
+        return int(week_start.timestamp()) + offset
+
+    async def set_digest(self, lobby_name: str, user_id: str, guild_id: Optional[str], channel_id: Optional[str], time: datetime.datetime) -> int:
+        '''
+        Passing channel_id None turns the digest off.
+        Returns INSUFFICIENT_PRIVILAGES, SUCCESS, INVALID_LOBBY
+        '''
+        lobby_hash = self._security.generate_lobby_hash(lobby_name)
+        if not await self._check_lobby_all(lobby_name):
+            return DatabaseEnums.INVALID_LOBBY
+        if not await self.is_admin(user_id, lobby_name):
+            return DatabaseEnums.INSUFFICIENT_PRIVILAGES
+
+        if channel_id is None or guild_id is None:
+            await self._execute("DELETE FROM Digests WHERE lobby_hash = ?", (lobby_hash,))
+            return DatabaseEnums.SUCCESS
+
+        await self._execute('''
+            INSERT INTO Digests (lobby_hash, guild_id, channel_id, last_sent_ts, next_due_ts) VALUES (?, ?, ?, NULL, ?)
+            ON CONFLICT (lobby_hash) DO UPDATE SET guild_id = excluded.guild_id, channel_id = excluded.channel_id
+        ''', (lobby_hash, guild_id, channel_id, self._next_digest_due(lobby_hash, time)))
+        return DatabaseEnums.SUCCESS
+
+    def _digest_shard_filter(self, shard_count: int, shard_ids: List[int]) -> str:
+        # Same formula Discord uses to assign guilds to shards
+        shard_placeholders = ", ".join("?" for _ in shard_ids)
+        return f"((CAST(guild_id AS INTEGER) >> 22) % ?) IN ({shard_placeholders})"
+
+    async def get_due_digests(self, time: datetime.datetime, shard_count: int, shard_ids: List[int], limit: int = 50) -> List[Dict[str, Any]]:
+        '''
+        Returns due digests of guilds on the given shards, oldest first.
+        '''
+        if not shard_ids:
+            return []
+        return await self._fetchall(f'''
+            SELECT Digests.lobby_hash, Lobbies.name, guild_id, channel_id, next_due_ts FROM Digests
+            JOIN Lobbies ON Lobbies.hash = Digests.lobby_hash
+            WHERE next_due_ts <= ? AND {self._digest_shard_filter(shard_count, shard_ids)}
+            ORDER BY next_due_ts LIMIT ?
+        ''', (int(time.timestamp()), shard_count, *shard_ids, limit))
+
+    async def get_next_digest_due(self, shard_count: int, shard_ids: List[int]) -> Optional[int]:
+        '''
+        Returns when the next digest of a guild on the given shards is due, if any.
+        '''
+        if not shard_ids:
+            return None
+        result = await self._fetchone(f"SELECT MIN(next_due_ts) AS next_due_ts FROM Digests WHERE {self._digest_shard_filter(shard_count, shard_ids)}",
+                                      (shard_count, *shard_ids))
+        return result["next_due_ts"] if result else None
+
+    async def postpone_digest(self, lobby_hash: str, due_ts: int, retry_ts: int) -> bool:
+        '''
+        Moves a digest that could not be posted to retry_ts, so it stops holding up the ones behind it.
+        Returns False if the cursor was already moved.
+        '''
+        rowcount = await self._execute("UPDATE Digests SET next_due_ts = ? WHERE lobby_hash = ? AND next_due_ts = ?",
+                                       (retry_ts, lobby_hash, due_ts))
+        return rowcount > 0
+
+    async def mark_digest_sent(self, lobby_hash: str, due_ts: int, time: datetime.datetime) -> bool:
+        '''
+        Moves the digest cursor past due_ts. Returns False if the cursor was already moved.
+        '''
+        due_time = datetime.datetime.fromtimestamp(due_ts, datetime.timezone.utc)
+        next_due_ts = self._next_digest_due(lobby_hash, max(due_time, time))
+        rowcount = await self._execute("UPDATE Digests SET last_sent_ts = ?, next_due_ts = ? WHERE lobby_hash = ? AND next_due_ts = ?",
+                                       (due_ts, next_due_ts, lobby_hash, due_ts))
+        return rowcount > 0
+
+
+STORAGE_BACKENDS = ("sqlite", "sqlalchemy")
+
+
+def create_database_manager(backend: str = "sqlite") -> DatabaseManager:
+    if backend == "sqlite":
+        return DatabaseManager()
+    elif backend == "sqlalchemy":
+        from sqlalchemy_database_manager import SQLAlchemyDatabaseManager
+        return SQLAlchemyDatabaseManager()
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import os
+import signal
+import sys
+from typing import List
+
+# Starts one storage service and several shard workers on this machine.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def split_shards(shard_count: int, workers: int) -> List[List[int]]:
+    workers = max(1, min(workers, shard_count))
+    chunk, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for i in range(workers):
+        end = start + chunk + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+async def main(args, passthrough: List[str]):
+    storage = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(BASE_DIR, "storage_service.py"),
+        "--socket", args.socket,
+        "--storage_backend", args.storage_backend,
+        start_new_session=True)
+    workers = []
+
+    for shard_ids in split_shards(args.shard_count, args.workers):
+        print(f"Starting worker for shards {shard_ids}")
+        worker = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(BASE_DIR, "main.py"),
+            "--storage", args.socket,
+            "--shard_count", str(args.shard_count),
+            "--shard_ids", *map(str, shard_ids),
+            *passthrough,
+            start_new_session=True)
+        workers.append(worker)
+
+    # Children run in their own sessions, so Ctrl+C or a signal to the process group only reaches
+    # the launcher, which then stops the workers before the storage service they depend on
+    stop_requested = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop_requested.set)
+        except NotImplementedError:
+            pass
+
+    try:
+        # If any process dies, take the rest down so the supervisor can restart everything
+        waiters = [asyncio.create_task(p.wait()) for p in [storage, *workers]]
+        waiters.append(asyncio.create_task(stop_requested.wait()))
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # Workers drain their commands first, the storage service still answers them meanwhile
+        for process in workers:
+            if process.returncode is None:
+                process.terminate()
+        await asyncio.gather(*(p.wait() for p in workers))
+        if storage.returncode is None:
+            storage.terminate()
+        await storage.wait()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("-w", "--workers", type=int, default=2,
+                            help="Number of shard worker processes.", required=False)
+    arg_parser.add_argument("-sc", "--shard_count", type=int, default=2,
+                            help="Total number of shards split across the workers.", required=False)
+    arg_parser.add_argument("-s", "--socket", type=str, default=os.path.join(BASE_DIR, "storage.sock"),
+                            help="Path of the storage service's Unix socket.", required=False)
+    arg_parser.add_argument("-sb", "--storage_backend", type=str, default="sqlite",
+                            help="Database backend used by the storage service.", required=False)
+    # Anything else (e.g. -t/-tgid) is forwarded to every worker
+    args, passthrough = arg_parser.parse_known_args()
+    asyncio.run(main(args, passthrough))
@@ -4,8 +4,15 @@ import discord
 from discord.ext import commands
 import bot
 import asyncio
-from database_manager import DatabaseManager
+from database_manager import STORAGE_BACKENDS, create_database_manager
+from backup_manager import BackupManager
+from season_scheduler import SeasonScheduler
+from storage_service import StorageClient
+from warm_state import load_warm_state, save_warm_state
 import argparse
+import signal
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 async def main(args):
@@ -22,13 +29,71 @@ async def main(args):
         raise ValueError(
             "You must pass in value for -tgid after enabling testing.")
 
-    db = DatabaseManager()
-    await db.initialize()
+    owns_database = args.storage is None
+    if not owns_database:
+        # Shard worker: the storage service owns the database and its backups
+        db = StorageClient(args.storage)
+        await db.initialize()
+    else:
+        db = create_database_manager(args.storage_backend)
+        await db.initialize()
+        backups = BackupManager(db.DB_FILE, args.backup_dir,
+                                interval_hours=args.backup_interval_hours, keep=args.backup_keep)
+        backups.start()
+        seasons = SeasonScheduler(db)
+        seasons.start()
+
+    shard_ids = args.shard_ids
+    sync_commands = shard_ids is None or 0 in shard_ids
     bot_instance: commands.Bot = bot.Bot(
-        database=db, testing_guild_id=testing_guild_id)
+        database=db, testing_guild_id=testing_guild_id, sync_commands=sync_commands,
+        shard_ids=shard_ids, shard_count=args.shard_count)
     await bot_instance.load_extension("cogs.bot_core")
+    await bot_instance.load_extension("cogs.digests")
+
+    snapshot_file = args.snapshot_file
+    if snapshot_file is None:
+        suffix = "" if shard_ids is None else "_" + "-".join(map(str, shard_ids))
+        snapshot_file = os.path.join(BASE_DIR, f"warm_state{suffix}.json")
+    warm_state = load_warm_state(snapshot_file)
+    if owns_database and not db.import_warm_state(warm_state.get("database")):
+        await db.build_running_chrono_index()
+    bot_instance.import_warm_state(warm_state.get("bot", {}))
+
+    stop_requested = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop_requested.set)
+        except NotImplementedError:
+            # Not available on Windows, Ctrl+C still raises KeyboardInterrupt there
+            pass
+
+    bot_task = asyncio.create_task(bot_instance.start(TOKEN))
+    stop_task = asyncio.create_task(stop_requested.wait())
+    await asyncio.wait([bot_task, stop_task], return_when=asyncio.FIRST_COMPLETED)
+    stop_task.cancel()
+
+    print("Shutting down...")
+    await bot_instance.drain(args.shutdown_timeout)
+    # Before the send queue and the database it uses go away
+    digests = bot_instance.get_cog("Digests")
+    if digests is not None:
+        await digests.stop(args.shutdown_timeout)
+    if owns_database:
+        await seasons.stop()
+        await backups.stop()
+    snapshot = {"bot": bot_instance.export_warm_state()}
+    await bot_instance.send_queue.close()
+    await bot_instance.close()
+    await db.close()
+    if owns_database:
+        # Exported after the last write so the snapshot matches the database file
+        snapshot["database"] = db.export_warm_state()
+    save_warm_state(snapshot_file, snapshot)
+    print("Shutdown complete.")
 
-    await bot_instance.start(TOKEN)
+    await bot_task
 
 
 if __name__ == "__main__":
@@ -37,5 +102,23 @@ if __name__ == "__main__":
                             " --testing_guild_id", required=False)
     arg_parser.add_argument("-tgid", "--testing_guild_id", type=int,
                             help="Set the testing guild id for instant command updates.", required=False)
+    arg_parser.add_argument("-bd", "--backup_dir", type=str, default=os.path.join(BASE_DIR, "backups"),
+                            help="Directory the database backups are written to.", required=False)
+    arg_parser.add_argument("-bi", "--backup_interval_hours", type=float, default=6.0,
+                            help="Hours between database backups.", required=False)
+    arg_parser.add_argument("-bk", "--backup_keep", type=int, default=7,
+                            help="Number of database backups to keep.", required=False)
+    arg_parser.add_argument("-s", "--storage", type=str, default=None,
+                            help="Unix socket of a running storage_service.py. Uses the local database if not set.", required=False)
+    arg_parser.add_argument("--shard_ids", type=int, nargs="+", default=None,
+                            help="Shards this process should run. Requires --shard_count.", required=False)
+    arg_parser.add_argument("--shard_count", type=int, default=None,
+                            help="Total number of shards across all processes.", required=False)
+    arg_parser.add_argument("-sb", "--storage_backend", type=str, choices=STORAGE_BACKENDS, default="sqlite",
+                            help="Database backend to use when this process owns the database.", required=False)
+    arg_parser.add_argument("-st", "--shutdown_timeout", type=float, default=25.0,
+                            help="Seconds to wait for running commands on shutdown.", required=False)
+    arg_parser.add_argument("--snapshot_file", type=str, default=None,
+                            help="Where the warm-start snapshot is kept. (Default: warm_state[_<shard ids>].json)", required=False)
     args = arg_parser.parse_args()
     asyncio.run(main(args))
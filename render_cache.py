@@ -0,0 +1,46 @@
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional
+from discord import Embed
+
+
+class RenderCache:
+    """Bounded LRU cache for rendered embeds."""
+
+    def __init__(self, max_entries: int = 256) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, Embed] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Embed]:
+        embed = self._entries.get(key)
+        if embed is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return embed
+
+    def put(self, key: Hashable, embed: Embed) -> None:
+        self._entries[key] = embed
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def export(self) -> List[List[Any]]:
+        return [[list(key), embed.to_dict()] for key, embed in self._entries.items()]
+
+    def load(self, entries: List[List[Any]]) -> None:
+        for key, embed_dict in entries:
+            self.put(tuple(key), Embed.from_dict(embed_dict))
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
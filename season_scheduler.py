@@ -0,0 +1,63 @@
+import asyncio
+import datetime
+from typing import Optional, TYPE_CHECKING
+from zoneinfo import ZoneInfo
+
+if TYPE_CHECKING:
+    from database_manager import DatabaseManager
+
+SEASON_PERIODS = ("weekly", "monthly")
+
+
+def next_season_reset(period: str, timezone: str, after: datetime.datetime) -> datetime.datetime:
+    '''
+    Returns the next local midnight starting a new week (Monday) or month
+    in the given timezone, strictly after the given time.
+    '''
+    zone = ZoneInfo(timezone)
+    local = after.astimezone(zone)
+    if period == "weekly":
+        next_date = local.date() + datetime.timedelta(days=7 - local.weekday())
+    elif period == "monthly":
+        if local.month == 12:
+            next_date = datetime.date(local.year + 1, 1, 1)
+        else:
+            next_date = datetime.date(local.year, local.month + 1, 1)
+    else:
+        raise ValueError(f"Unknown season period: {period}")
+    return datetime.datetime.combine(next_date, datetime.time(), tzinfo=zone)
+
+
+class SeasonScheduler:
+    """Single background task that ends scheduled seasons for every lobby."""
+
+    def __init__(self, database: "DatabaseManager", max_sleep: float = 60.0) -> None:
+        self.db = database
+        self.max_sleep = max_sleep
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            sleep_for = self.max_sleep
+            try:
+                now = datetime.datetime.now(datetime.timezone.utc)
+                next_reset_ts = await self.db.run_due_season_resets(now)
+                if next_reset_ts is not None:
+                    sleep_for = min(max(next_reset_ts - now.timestamp(), 0), self.max_sleep)
+            except Exception as e:
+                print(f"Season scheduler failed: {e}")
+            await asyncio.sleep(sleep_for)
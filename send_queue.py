@@ -0,0 +1,76 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+from discord.abc import Messageable
+
+
+class SendQueueClosed(Exception):
+    pass
+
+
+class SendQueue:
+    """
+    Serializes bulk channel messages so they stay under Discord's per-channel
+    and global rate limits instead of relying on 429 retries.
+    """
+
+    def __init__(self, per_channel_interval: float = 1.0, global_rate: float = 20.0) -> None:
+        self.per_channel_interval = per_channel_interval
+        self.global_interval = 1.0 / global_rate
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._channel_ready_at: Dict[int, float] = {}
+        self._global_ready_at = 0.0
+        self._worker: Optional[asyncio.Task] = None
+
+    async def send(self, channel: Messageable, **kwargs: Any):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((channel, kwargs, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            channel, kwargs, future = await self._queue.get()
+            channel_id = getattr(channel, "id", 0)
+            try:
+                now = time.monotonic()
+                ready_at = max(self._global_ready_at,
+                               self._channel_ready_at.get(channel_id, 0.0))
+                if ready_at > now:
+                    await asyncio.sleep(ready_at - now)
+
+                message = await channel.send(**kwargs)
+                if not future.done():
+                    future.set_result(message)
+            except asyncio.CancelledError:
+                # The message may or may not have gone out, the sender has to decide what to do
+                if not future.done():
+                    future.set_exception(SendQueueClosed("Send queue closed while sending."))
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                sent_at = time.monotonic()
+                self._global_ready_at = sent_at + self.global_interval
+                self._channel_ready_at[channel_id] = sent_at + self.per_channel_interval
+                if len(self._channel_ready_at) > 1024:
+                    self._channel_ready_at = {
+                        c: t for c, t in self._channel_ready_at.items() if t > sent_at}
+                self._queue.task_done()
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        # Nothing sends these anymore, so their senders get an error instead of waiting forever
+        while not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            self._queue.task_done()
+            if not future.done():
+                future.set_exception(SendQueueClosed("Send queue closed before sending."))
@@ -0,0 +1,53 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from database_manager import BulkParams, DatabaseManager
+
+
+class SQLAlchemyDatabaseManager(DatabaseManager):
+    '''
+    DatabaseManager backed by a pooled async SQLAlchemy engine instead of a
+    new aiosqlite connection per query. Pooled connections keep their
+    statement caches, so repeated queries skip re-preparing.
+    '''
+
+    def __init__(self, database_url: Optional[str] = None, pool_size: int = 5, max_overflow: int = 10) -> None:
+        super().__init__()
+        if database_url is None:
+            database_url = f"sqlite+aiosqlite:///{self.DB_FILE}"
+        self.database_url = database_url
+        self._engine: AsyncEngine = create_async_engine(
+            database_url, pool_size=pool_size, max_overflow=max_overflow)
+
+    async def _execute(self, query: str, params: Sequence[Any] = ()) -> int:
+        async with self._engine.begin() as conn:
+            result = await conn.exec_driver_sql(query, tuple(params))
+            return result.rowcount
+
+    async def _transaction(self, statements: List[Tuple[str, Sequence[Any]]]) -> List[int]:
+        rowcounts = []
+        async with self._engine.begin() as conn:
+            for query, params in statements:
+                if isinstance(params, BulkParams):
+                    # A list of parameter tuples is sent as a single executemany(), an empty one as no parameters
+                    if not params:
+                        rowcounts.append(0)
+                        continue
+                    result = await conn.exec_driver_sql(query, [tuple(row) for row in params])
+                else:
+                    result = await conn.exec_driver_sql(query, tuple(params))
+                rowcounts.append(result.rowcount)
+        return rowcounts
+
+    async def _fetchone(self, query: str, params: Sequence[Any] = ()) -> Optional[Dict[str, Any]]:
+        async with self._engine.connect() as conn:
+            result = await conn.exec_driver_sql(query, tuple(params))
+            row = result.mappings().fetchone()
+            return dict(row) if row else None
+
+    async def _fetchall(self, query: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        async with self._engine.connect() as conn:
+            result = await conn.exec_driver_sql(query, tuple(params))
+            return [dict(row) for row in result.mappings().fetchall()]
+
+    async def close(self):
+        await self._engine.dispose()
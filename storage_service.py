@@ -0,0 +1,264 @@
+import argparse
+import asyncio
+import datetime
+import inspect
+import json
+import os
+import signal
+from typing import Any, Dict, Optional
+from database_manager import DatabaseManager, STORAGE_BACKENDS, create_database_manager
+from backup_manager import BackupManager
+from season_scheduler import SeasonScheduler
+from warm_state import load_warm_state, save_warm_state
+
+# Single process that owns DatabaseManager so several shard workers don't fight over lobbies.db locks.
+# It listens on a Unix socket only its own user can open, since every DatabaseManager method
+# (deleting lobbies included) is callable through it without further authentication.
+# Messages are JSON lines: {"id", "method", "args"} -> {"id", "result"} or {"id", "error"}.
+# Requests on one connection are handled concurrently, so clients can pipeline them.
+
+STREAM_LIMIT = 2 ** 24
+DEFAULT_SOCKET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "storage.sock")
+_EXTRA_METHODS = {"_get_lobby_name"}
+_EXCLUDED_METHODS = {"initialize", "close"}
+
+
+def _exposed_methods() -> set[str]:
+    return {
+        name for name, member in inspect.getmembers(DatabaseManager, inspect.iscoroutinefunction)
+        if (not name.startswith("_") or name in _EXTRA_METHODS) and name not in _EXCLUDED_METHODS
+    }
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    return value
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "__datetime__" in value:
+            return datetime.datetime.fromisoformat(value["__datetime__"])
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+class StorageError(Exception):
+    pass
+
+
+class StorageServer:
+    def __init__(self, database: DatabaseManager, socket_path: str = DEFAULT_SOCKET) -> None:
+        self.db = database
+        self.socket_path = socket_path
+        self._methods = _exposed_methods()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._in_flight: set[asyncio.Task] = set()
+
+    async def start(self):
+        # The umask makes the socket 0600 from the moment it is bound, chmod is just a safety net
+        old_umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(self._handle_connection, self.socket_path, limit=STREAM_LIMIT)
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.socket_path, 0o600)
+        print(f"Storage service listening on {self.socket_path}")
+
+    async def drain(self, timeout: float) -> bool:
+        '''
+        Stops accepting connections and waits for requests that are already running.
+        Returns False if some were still running at the deadline.
+        '''
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        if not self._in_flight:
+            return True
+        print(f"Waiting for {len(self._in_flight)} storage requests to finish...")
+        _, pending = await asyncio.wait(self._in_flight, timeout=timeout)
+        if pending:
+            print(f"{len(pending)} storage requests were still running at the shutdown deadline.")
+        return not pending
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        write_lock = asyncio.Lock()
+        pending: set[asyncio.Task] = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(
+                    self._handle_request(line, writer, write_lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+        except ConnectionError:
+            pass
+        finally:
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            writer.close()
+
+    async def _handle_request(self, line: bytes, writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+        # Every line gets an answer, a malformed request or an unserializable result included,
+        # otherwise the client would wait on it until its timeout
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            method = request.get("method")
+            if method not in self._methods:
+                raise StorageError(f"Unknown storage method: {method}")
+            result = await getattr(self.db, method)(*_decode(request.get("args", [])))
+            data = json.dumps({"id": request_id, "result": _encode(result)})
+        except Exception as e:
+            data = json.dumps({"id": request_id, "error": f"{type(e).__name__}: {e}"})
+
+        async with write_lock:
+            writer.write(data.encode("utf-8") + b"\n")
+            await writer.drain()
+
+
+class StorageClient:
+    '''
+    Stands in for DatabaseManager inside shard workers. Every exposed
+    DatabaseManager coroutine is forwarded to the storage service.
+    '''
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, timeout: float = 30.0) -> None:
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._methods = _exposed_methods()
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_id = 0
+
+    async def initialize(self, retries: int = 50, retry_delay: float = 0.2):
+        for attempt in range(retries):
+            try:
+                self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path, limit=STREAM_LIMIT)
+                break
+            except (ConnectionError, FileNotFoundError):
+                if attempt == retries - 1:
+                    raise
+                await asyncio.sleep(retry_delay)
+        self._reader_task = asyncio.create_task(self._read_responses())
+        print(f"Connected to storage service at {self.socket_path}")
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+
+    async def _read_responses(self):
+        assert self._reader is not None
+        try:
+            while line := await self._reader.readline():
+                try:
+                    response = json.loads(line)
+                except ValueError:
+                    print(f"Ignoring malformed response from storage service: {line[:200]!r}")
+                    continue
+                future = self._pending.pop(response.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in response:
+                    future.set_exception(StorageError(response["error"]))
+                else:
+                    future.set_result(_decode(response["result"]))
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(StorageError(
+                        "Connection to storage service lost."))
+            self._pending.clear()
+
+    async def call(self, method: str, *args: Any) -> Any:
+        if self._writer is None:
+            raise StorageError("Storage client is not connected.")
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        request = {"id": request_id, "method": method, "args": _encode(list(args))}
+        # No waiting for the previous response here, so concurrent commands share the connection
+        self._writer.write(json.dumps(request).encode("utf-8") + b"\n")
+        try:
+            await self._writer.drain()
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise StorageError(f"Storage method {method} timed out after {self.timeout}s.") from None
+        finally:
+            self._pending.pop(request_id, None)
+
+    def __getattr__(self, name: str):
+        if name.startswith("__") or name not in self._methods:
+            raise AttributeError(name)
+
+        async def remote_method(*args: Any) -> Any:
+            return await self.call(name, *args)
+        return remote_method
+
+
+async def main(args):
+    db = create_database_manager(args.storage_backend)
+    await db.initialize()
+    if not db.import_warm_state(load_warm_state(args.snapshot_file).get("database")):
+        await db.build_running_chrono_index()
+    backups = BackupManager(db.DB_FILE, args.backup_dir,
+                            interval_hours=args.backup_interval_hours, keep=args.backup_keep)
+    backups.start()
+    seasons = SeasonScheduler(db)
+    seasons.start()
+    server = StorageServer(db, args.socket)
+    await server.start()
+
+    stop_requested = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop_requested.set)
+        except NotImplementedError:
+            pass
+    await stop_requested.wait()
+
+    print("Shutting down storage service...")
+    await server.drain(args.shutdown_timeout)
+    await seasons.stop()
+    await backups.stop()
+    await db.close()
+    save_warm_state(args.snapshot_file, {"database": db.export_warm_state()})
+    print("Storage service stopped.")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("-s", "--socket", type=str, default=DEFAULT_SOCKET,
+                            help="Path of the Unix socket the storage service listens on.", required=False)
+    arg_parser.add_argument("-bd", "--backup_dir", type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "backups"),
+                            help="Directory the database backups are written to.", required=False)
+    arg_parser.add_argument("-bi", "--backup_interval_hours", type=float, default=6.0,
+                            help="Hours between database backups.", required=False)
+    arg_parser.add_argument("-bk", "--backup_keep", type=int, default=7,
+                            help="Number of database backups to keep.", required=False)
+    arg_parser.add_argument("-sb", "--storage_backend", type=str, choices=STORAGE_BACKENDS, default="sqlite",
+                            help="Database backend to use when this process owns the database.", required=False)
+    arg_parser.add_argument("-st", "--shutdown_timeout", type=float, default=25.0,
+                            help="Seconds to wait for running requests on shutdown.", required=False)
+    arg_parser.add_argument("--snapshot_file", type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "warm_state_storage.json"),
+                            help="Where the warm-start snapshot is kept.", required=False)
+    args = arg_parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,76 @@
+from typing import Tuple
+import numpy as np
+
+# Vectorized helpers for study statistics. Sessions are passed around as
+# columnar arrays of UTC epoch seconds (starts[i], ends[i]).
+
+SECONDS_PER_HOUR = 3600
+HOURS_PER_DAY = 24
+# 1970-01-01 was a Thursday, weekday 3 when Monday is 0
+EPOCH_WEEKDAY = 3
+
+
+def _split_by_hour(starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Splits every session at hour boundaries.
+    Returns the absolute hour index of each piece and the seconds spent in it.
+    '''
+    valid = ends > starts
+    starts, ends = starts[valid], ends[valid]
+    if starts.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    first_hour = starts // SECONDS_PER_HOUR
+    last_hour = (ends - 1) // SECONDS_PER_HOUR
+    pieces = last_hour - first_hour + 1
+
+    session_of_piece = np.repeat(np.arange(starts.size), pieces)
+    piece_offsets = np.arange(pieces.sum()) - \
+        np.repeat(np.cumsum(pieces) - pieces, pieces)
+    hours = first_hour[session_of_piece] + piece_offsets
+
+    piece_starts = np.maximum(starts[session_of_piece], hours * SECONDS_PER_HOUR)
+    piece_ends = np.minimum(ends[session_of_piece],
+                            (hours + 1) * SECONDS_PER_HOUR)
+    return hours, piece_ends - piece_starts
+
+
+def weekly_heatmap(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    '''
+    Returns a 7x24 array of seconds studied per (weekday, hour), Monday first.
+    '''
+    hours, seconds = _split_by_hour(starts, ends)
+    days = hours // HOURS_PER_DAY
+    weekdays = (days + EPOCH_WEEKDAY) % 7
+    cells = weekdays * HOURS_PER_DAY + hours % HOURS_PER_DAY
+    heatmap = np.bincount(cells, weights=seconds,
+                          minlength=7 * HOURS_PER_DAY)
+    return heatmap.astype(np.int64).reshape(7, HOURS_PER_DAY)
+
+
+def study_days(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    '''
+    Returns the sorted unique days (days since epoch) with any study time.
+    '''
+    hours, seconds = _split_by_hour(starts, ends)
+    return np.unique(hours[seconds > 0] // HOURS_PER_DAY)
+
+
+def streaks(days: np.ndarray) -> Tuple[int, int]:
+    '''
+    Returns (longest streak, length of the streak ending on the last study day).
+    '''
+    if days.size == 0:
+        return 0, 0
+    breaks = np.flatnonzero(np.diff(days) != 1) + 1
+    run_bounds = np.concatenate(([0], breaks, [days.size]))
+    run_lengths = np.diff(run_bounds)
+    return int(run_lengths.max()), int(run_lengths[-1])
+
+
+def percentile_rank(totals: np.ndarray, value: float) -> float:
+    if totals.size == 0:
+        return 0.0
+    below = np.count_nonzero(totals < value)
+    equal = np.count_nonzero(totals == value)
+    return float((below + 0.5 * equal) / totals.size * 100)
@@ -0,0 +1,21 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database_manager import DatabaseManager, STORAGE_BACKENDS, create_database_manager
+
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    # Every test gets its own lobbies.db instead of the one next to the bot
+    path = str(tmp_path / "lobbies.db")
+    monkeypatch.setattr(DatabaseManager, "DB_FILE", path)
+    return path
+
+
+@pytest.fixture(params=STORAGE_BACKENDS)
+def database(request, db_file):
+    # Not initialized yet: the engine of the SQLAlchemy backend has to be used from the test's event loop
+    return create_database_manager(request.param)
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import sqlite3
+import time
+from backup_manager import BackupManager
+
+ROW_COUNT = 4000
+
+
+def _create_database(path: str):
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE t (x TEXT)")
+    db.executemany("INSERT INTO t VALUES (?)", [("x" * 1000,)] * ROW_COUNT)
+    db.commit()
+    db.close()
+
+
+async def _keep_writing(path: str, stop: asyncio.Event, interval: float):
+    while not stop.is_set():
+        await asyncio.to_thread(_insert_row, path)
+        await asyncio.sleep(interval)
+
+
+def _insert_row(path: str):
+    db = sqlite3.connect(path)
+    db.execute("INSERT INTO t VALUES ('y')")
+    db.commit()
+    db.close()
+
+
+def test_backup_finishes_under_concurrent_writes(tmp_path):
+    source = str(tmp_path / "lobbies.db")
+    _create_database(source)
+    # Small steps with pauses take ~0.5s in total, so the writes restart the copy many times
+    manager = BackupManager(source, str(tmp_path / "backups"), pages_per_step=8, step_sleep=0.005)
+
+    async def scenario():
+        stop = asyncio.Event()
+        writer = asyncio.create_task(_keep_writing(source, stop, 0.02))
+        try:
+            return await asyncio.wait_for(manager.backup(), 30)
+        finally:
+            stop.set()
+            await writer
+
+    path = asyncio.run(scenario())
+    assert path is not None and os.listdir(tmp_path / "backups") == [os.path.basename(path)]
+    backup = sqlite3.connect(path)
+    assert backup.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    assert backup.execute("SELECT COUNT(*) FROM t").fetchone()[0] >= ROW_COUNT
+    backup.close()
+
+
+def test_stop_aborts_a_running_backup(tmp_path):
+    source = str(tmp_path / "lobbies.db")
+    _create_database(source)
+    manager = BackupManager(source, str(tmp_path / "backups"), pages_per_step=1, step_sleep=0.05)
+
+    async def scenario():
+        manager.start()
+        await asyncio.sleep(0.2)
+        started = time.perf_counter()
+        await manager.stop(timeout=5)
+        return time.perf_counter() - started
+
+    assert asyncio.run(scenario()) < 1
+    assert os.listdir(tmp_path / "backups") == []
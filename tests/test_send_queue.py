@@ -0,0 +1,41 @@
+import asyncio
+import pytest
+from send_queue import SendQueue, SendQueueClosed
+
+
+class SlowChannel:
+    def __init__(self, channel_id: int, delay: float) -> None:
+        self.id = channel_id
+        self.delay = delay
+        self.sent = []
+
+    async def send(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        self.sent.append(kwargs)
+        return kwargs
+
+
+def test_messages_are_sent_in_order():
+    async def scenario():
+        queue = SendQueue(per_channel_interval=0.01, global_rate=1000)
+        channel = SlowChannel(1, 0)
+        results = await asyncio.gather(*(queue.send(channel, content=str(i)) for i in range(5)))
+        await queue.close()
+        return channel, results
+
+    channel, results = asyncio.run(scenario())
+    assert [message["content"] for message in channel.sent] == ["0", "1", "2", "3", "4"]
+    assert results == channel.sent
+
+
+def test_close_fails_in_flight_and_queued_sends():
+    async def scenario():
+        queue = SendQueue(per_channel_interval=0, global_rate=1000)
+        channel = SlowChannel(1, 10)
+        sends = [asyncio.create_task(queue.send(channel, content=str(i))) for i in range(3)]
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(queue.close(), 1)
+        return await asyncio.wait_for(asyncio.gather(*sends, return_exceptions=True), 1)
+
+    results = asyncio.run(scenario())
+    assert len(results) == 3 and all(isinstance(result, SendQueueClosed) for result in results)
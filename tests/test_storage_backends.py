@@ -0,0 +1,293 @@
+import asyncio
+import datetime
+import time
+from database_manager import BulkParams, DatabaseEnums, DatabaseManager
+
+START = datetime.datetime(2026, 1, 5, 9, 0, tzinfo=datetime.timezone.utc)
+BENCHMARK_CYCLES = 200
+BENCHMARK_ROWS = 5000
+
+
+def _run(database: DatabaseManager, scenario):
+    async def wrapper():
+        await database.initialize()
+        try:
+            return await scenario(database)
+        finally:
+            await database.close()
+    return asyncio.run(wrapper())
+
+
+def test_lobby_lifecycle(database):
+    async def scenario(db: DatabaseManager):
+        assert await db.create_lobby("1", "lobby") == DatabaseEnums.PASSWORD_NOT_ENTERED
+        assert await db.create_lobby("1", "lobby", False, "secret") == DatabaseEnums.SUCCESS
+        assert await db.create_lobby("2", "lobby", False, "secret") == DatabaseEnums.LOBBY_EXISTS
+        assert await db.join_lobby("lobby", "2", "wrong") == DatabaseEnums.INVALID_PASSWORD
+        assert await db.join_lobby("missing", "2", "secret") == DatabaseEnums.INVALID_LOBBY
+        assert await db.join_lobby("lobby", "2", "secret") == DatabaseEnums.SUCCESS
+        assert await db.join_lobby("lobby", "2", "secret") == DatabaseEnums.USER_ALREADY_EXISTS_IN_LOBBY
+        assert len(await db.get_user_lobbies("2")) == 1
+        assert await db.is_admin("1", "lobby") and not await db.is_admin("2", "lobby")
+
+        version = await db.get_lobby_version("lobby")
+        assert await db.start_chrono("lobby", "2", START) == DatabaseEnums.SUCCESS
+        assert await db.start_chrono("lobby", "2", START) == DatabaseEnums.CHRONO_ALREADY_RUNNING
+        assert await db.stop_chrono("lobby", "2", START + datetime.timedelta(minutes=30)) == (DatabaseEnums.SUCCESS, 1800)
+        assert (await db.stop_chrono("lobby", "2", START))[0] == DatabaseEnums.CHRONO_ALREADY_NOT_RUNNING
+        assert await db.get_lobby_version("lobby") != version
+
+        totals = {user["user_id"]: user["total_seconds"] for user in await db.get_lobby_users("lobby")}
+        assert totals == {"1": 0, "2": 1800}
+        result, stats = await db.get_user_stats("lobby", "2", START)
+        assert result == DatabaseEnums.SUCCESS
+        assert (stats["session_count"], stats["total_seconds"], stats["busiest_hour"]) == (1, 1800, 9)
+
+        assert await db.reset_lobby("lobby", "2", START) == (DatabaseEnums.INSUFFICIENT_PRIVILAGES, 0)
+        assert await db.reset_lobby("lobby", "1", START + datetime.timedelta(hours=1)) == (DatabaseEnums.SUCCESS, 1)
+        assert await db.get_current_season("lobby") == 2
+        result, standings = await db.get_season_standings("lobby", 1)
+        assert result == DatabaseEnums.SUCCESS
+        assert {user["user_id"]: user["total_seconds"] for user in standings} == {"1": 0, "2": 1800}
+        assert all(user["total_seconds"] == 0 for user in await db.get_lobby_users("lobby"))
+
+        assert await db.remove_user_from_lobby("lobby", "2", "1") == DatabaseEnums.INSUFFICIENT_PRIVILAGES
+        assert await db.remove_user_from_lobby("lobby", "1", "2") == DatabaseEnums.SUCCESS
+        assert await db.get_user_lobbies("2") == []
+        assert await db.delete_lobby("2", "lobby") == DatabaseEnums.INSUFFICIENT_PRIVILAGES
+        assert await db.delete_lobby("1", "lobby") == DatabaseEnums.SUCCESS
+        assert await db.get_lobby_users("lobby") == []
+        assert not db._stats_cache
+    _run(database, scenario)
+
+
+def test_chrono_throughput(database):
+    '''
+    Small benchmark of the hottest write path. It only fails on errors,
+    run with -s to see the numbers for each backend.
+    '''
+    async def scenario(db: DatabaseManager):
+        await db.create_lobby("1", "bench", False, "secret")
+        started = time.perf_counter()
+        for i in range(BENCHMARK_CYCLES):
+            moment = START + datetime.timedelta(minutes=2 * i)
+            assert await db.start_chrono("bench", "1", moment) == DatabaseEnums.SUCCESS
+            assert (await db.stop_chrono("bench", "1", moment + datetime.timedelta(minutes=1)))[0] == DatabaseEnums.SUCCESS
+        return time.perf_counter() - started
+
+    elapsed = _run(database, scenario)
+    print(f"{type(database).__name__}: {BENCHMARK_CYCLES} start/stop cycles in {elapsed:.2f}s " +
+          f"({BENCHMARK_CYCLES / elapsed:.0f} cycles/s)")
+
+
+def test_bulk_transaction(database):
+    async def scenario(db: DatabaseManager):
+        insert = "INSERT INTO Sessions (lobby_hash, user_id, start_ts, end_ts) VALUES (?, ?, ?, ?)"
+        await db._transaction([
+            (insert, ("lobby", "1", 0, 10)),
+            (insert, BulkParams(("lobby", str(i), i, i + 60) for i in range(BENCHMARK_ROWS))),
+            (insert, BulkParams()),
+        ])
+        row = await db._fetchone("SELECT COUNT(*) AS count, SUM(end_ts - start_ts) AS total FROM Sessions WHERE lobby_hash = ?",
+                                 ("lobby",))
+        assert (row["count"], row["total"]) == (BENCHMARK_ROWS + 1, BENCHMARK_ROWS * 60 + 10)
+
+        started = time.perf_counter()
+        await db._transaction([(insert, BulkParams(("bulk", str(i), i, i + 60) for i in range(BENCHMARK_ROWS)))])
+        bulk_elapsed = time.perf_counter() - started
+        started = time.perf_counter()
+        await db._transaction([(insert, ("single", str(i), i, i + 60)) for i in range(BENCHMARK_ROWS)])
+        single_elapsed = time.perf_counter() - started
+        return bulk_elapsed, single_elapsed
+
+    bulk_elapsed, single_elapsed = _run(database, scenario)
+    print(f"{type(database).__name__}: {BENCHMARK_ROWS} rows in one transaction, " +
+          f"{bulk_elapsed:.3f}s with executemany, {single_elapsed:.3f}s one statement at a time")
+
+
+def _before_next_transaction(db: DatabaseManager, action):
+    '''
+    Runs action right before the next _transaction commits its statements, i.e. between
+    the reads and the writes of whatever called it.
+    '''
+    transaction = db._transaction
+
+    async def interleaved(statements):
+        db._transaction = transaction
+        await action()
+        return await transaction(statements)
+    db._transaction = interleaved
+
+
+def test_chrono_running_across_resets(database):
+    async def scenario(db: DatabaseManager):
+        hour = datetime.timedelta(hours=1)
+        await db.create_lobby("1", "lobby", False, "secret")
+        for user_id in ("2", "3"):
+            await db.join_lobby("lobby", user_id, "secret")
+        assert await db.set_season_schedule("lobby", "1", "weekly", "UTC", START) == DatabaseEnums.SUCCESS
+        for user_id in ("1", "2", "3"):
+            await db.start_chrono("lobby", user_id, START)
+
+        # The hour before the manual reset belongs to season 1. User 2 stops two hours in,
+        # between the reset's reads and its writes, and still gets exactly one hour in season 1
+        stop_results = []
+
+        async def stop_user_2():
+            stop_results.append(await db.stop_chrono("lobby", "2", START + 2 * hour))
+        _before_next_transaction(db, stop_user_2)
+        assert await db.reset_lobby("lobby", "1", START + hour) == (DatabaseEnums.SUCCESS, 1)
+        assert stop_results == [(DatabaseEnums.SUCCESS, 7200)]
+        result, standings = await db.get_season_standings("lobby", 1)
+        assert {user["user_id"]: user["total_seconds"] for user in standings} == {"1": 3600, "2": 3600, "3": 3600}
+
+        # The scheduled reset on Monday 00:00 closes season 2 with the time since the manual reset.
+        # It runs while user 3 is being stopped, after the stop read the running chronometer
+        scheduled_reset = datetime.datetime(2026, 1, 12, tzinfo=datetime.timezone.utc)
+        reset_results = []
+
+        async def run_resets():
+            reset_results.append(await db.run_due_season_resets(scheduled_reset + hour))
+        _before_next_transaction(db, run_resets)
+        result, seconds = await db.stop_chrono("lobby", "3", scheduled_reset + hour)
+        assert (result, seconds) == (DatabaseEnums.SUCCESS, int((scheduled_reset + hour - START).total_seconds()))
+        next_reset_ts = int((scheduled_reset + 7 * 24 * hour).timestamp())
+        assert reset_results == [next_reset_ts]
+        assert await db.run_due_season_resets(scheduled_reset + hour) == next_reset_ts
+        assert await db.get_current_season("lobby") == 3
+        season_2_seconds = int((scheduled_reset - START - hour).total_seconds())
+        result, standings = await db.get_season_standings("lobby", 2)
+        assert {user["user_id"]: user["total_seconds"] for user in standings} == {"1": season_2_seconds, "2": 3600, "3": season_2_seconds}
+
+        # Stopping reports the whole session but only credits season 3 with its own part
+        result, seconds = await db.stop_chrono("lobby", "1", scheduled_reset + 2 * hour)
+        assert (result, seconds) == (DatabaseEnums.SUCCESS, 3600 + season_2_seconds + 7200)
+        totals = {user["user_id"]: user["total_seconds"] for user in await db.get_lobby_users("lobby")}
+        assert totals == {"1": 7200, "2": 0, "3": 3600}
+        # A stop that lost the race to another stop is answered from the database
+        assert (await db.stop_chrono("lobby", "1", scheduled_reset + 3 * hour))[0] == DatabaseEnums.CHRONO_ALREADY_NOT_RUNNING
+    _run(database, scenario)
+
+
+def test_weekly_digest(database):
+    async def scenario(db: DatabaseManager):
+        hour = datetime.timedelta(hours=1)
+        week_start = START - 9 * hour
+        week_end = week_start + 7 * 24 * hour
+        await db.create_lobby("1", "lobby", False, "secret")
+        for user_id in ("2", "3", "4"):
+            await db.join_lobby("lobby", user_id, "secret")
+        sessions = [
+            ("1", week_start - hour, week_start + hour),   # only the hour inside the week counts
+            ("2", START, START + 2 * hour),
+            ("2", START + 24 * hour, START + 25 * hour),
+            ("3", week_end - hour, week_end + 5 * hour),   # only the hour before Monday counts
+            ("4", week_end, week_end + hour),              # next week
+        ]
+        for user_id, start, end in sessions:
+            await db.start_chrono("lobby", user_id, start)
+            await db.stop_chrono("lobby", user_id, end)
+
+        top = await db.get_top_lobby_users("lobby", week_start, week_end, 2)
+        assert top == [{"user_id": "2", "total_seconds": 10800}, {"user_id": "1", "total_seconds": 3600}]
+        assert len(await db.get_top_lobby_users("lobby", week_start, week_end)) == 3
+
+        assert await db.set_digest("lobby", "1", "0", "1", START) == DatabaseEnums.SUCCESS
+        due_ts = await db.get_next_digest_due(1, [0])
+        # Guild 0 is on shard 0, workers of other shards neither send nor wait for it
+        assert await db.get_next_digest_due(2, [0]) == due_ts
+        assert await db.get_next_digest_due(2, [1]) is None
+        assert await db.get_next_digest_due(2, []) is None
+        assert week_end.timestamp() <= due_ts < week_end.timestamp() + db.DIGEST_WINDOW_SECONDS
+        due_time = datetime.datetime.fromtimestamp(due_ts, datetime.timezone.utc)
+        digest_hash = db._security.generate_lobby_hash("lobby")
+        assert [digest["lobby_hash"] for digest in await db.get_due_digests(due_time, 1, [0])] == [digest_hash]
+
+        # A postponed digest leaves the batch until its retry time, then is sent for the same week
+        assert await db.postpone_digest(digest_hash, due_ts, due_ts + 60)
+        assert not await db.postpone_digest(digest_hash, due_ts, due_ts + 60)
+        assert await db.get_due_digests(due_time, 1, [0]) == []
+        assert await db.get_due_digests(due_time + datetime.timedelta(seconds=60), 2, [1]) == []
+        assert await db.mark_digest_sent(digest_hash, due_ts + 60, due_time + datetime.timedelta(seconds=60))
+        assert await db.get_next_digest_due(1, [0]) == due_ts + 7 * 24 * 3600
+    _run(database, scenario)
+
+
+async def _running_rows(db: DatabaseManager, lobby_name: str) -> dict:
+    table_name = f"lobby_{db._security.generate_lobby_hash(lobby_name)}"
+    rows = await db._fetchall(f'SELECT user_id, is_running, total_seconds FROM "{table_name}"')
+    return {row["user_id"]: (bool(row["is_running"]), row["total_seconds"]) for row in rows}
+
+
+def _start_two_chronos(database: DatabaseManager):
+    async def scenario(db: DatabaseManager):
+        await db.create_lobby("1", "lobby", False, "secret")
+        await db.join_lobby("lobby", "2", "secret")
+        await db.join_lobby("lobby", "3", "secret")
+        await db.start_chrono("lobby", "1", START)
+        await db.start_chrono("lobby", "2", START)
+        await db.stop_chrono("lobby", "2", START + datetime.timedelta(minutes=10))
+    _run(database, scenario)
+
+
+async def _check_against_database(db: DatabaseManager):
+    hour = datetime.timedelta(hours=1)
+    # Answered from the index, and the database agrees
+    assert await db.start_chrono("lobby", "1", START + hour) == DatabaseEnums.CHRONO_ALREADY_RUNNING
+    assert (await db.stop_chrono("lobby", "2", START + hour))[0] == DatabaseEnums.CHRONO_ALREADY_NOT_RUNNING
+    assert (await db.stop_chrono("lobby", "3", START + hour))[0] == DatabaseEnums.CHRONO_ALREADY_NOT_RUNNING
+    assert await _running_rows(db, "lobby") == {"1": (True, 0), "2": (False, 600), "3": (False, 0)}
+
+    assert await db.stop_chrono("lobby", "1", START + hour) == (DatabaseEnums.SUCCESS, 3600)
+    assert await db.start_chrono("lobby", "3", START + hour) == DatabaseEnums.SUCCESS
+    assert await _running_rows(db, "lobby") == {"1": (False, 3600), "2": (False, 600), "3": (True, 0)}
+    assert set(db._running_chronos) == {(db._security.generate_lobby_hash("lobby"), "3")}
+
+
+def test_running_index_cold_rebuild(database):
+    _start_two_chronos(database)
+    restarted = type(database)()
+
+    async def scenario(db: DatabaseManager):
+        await db.build_running_chrono_index()
+        assert db._running_index_ready
+        assert set(db._running_chronos) == {(db._security.generate_lobby_hash("lobby"), "1")}
+        await _check_against_database(db)
+    _run(restarted, scenario)
+
+
+def test_running_index_warm_import(database):
+    _start_two_chronos(database)
+    exporter = type(database)()
+    _run(exporter, DatabaseManager.build_running_chrono_index)
+    state = exporter.export_warm_state()
+
+    async def scenario(db: DatabaseManager):
+        assert db.import_warm_state(state)
+        assert db._running_index_ready
+        await _check_against_database(db)
+    _run(type(database)(), scenario)
+
+
+def test_running_index_rejects_stale_snapshot(database):
+    _start_two_chronos(database)
+    exporter = type(database)()
+    _run(exporter, DatabaseManager.build_running_chrono_index)
+    state = exporter.export_warm_state()
+
+    # Another process writes after the snapshot: user 1 stops, user 3 starts
+    async def write_after_export(db: DatabaseManager):
+        await db.stop_chrono("lobby", "1", START + datetime.timedelta(minutes=30))
+        await db.start_chrono("lobby", "3", START + datetime.timedelta(minutes=30))
+    _run(type(database)(), write_after_export)
+
+    async def scenario(db: DatabaseManager):
+        assert not db.import_warm_state(state)
+        assert not db._running_index_ready and db._running_chronos == {}
+        await db.build_running_chrono_index()
+        hour = datetime.timedelta(hours=1)
+        # The stale snapshot would have answered both of these wrongly
+        assert (await db.stop_chrono("lobby", "1", START + hour))[0] == DatabaseEnums.CHRONO_ALREADY_NOT_RUNNING
+        assert await db.stop_chrono("lobby", "3", START + hour) == (DatabaseEnums.SUCCESS, 1800)
+        assert await _running_rows(db, "lobby") == {"1": (False, 1800), "2": (False, 600), "3": (False, 1800)}
+    _run(type(database)(), scenario)
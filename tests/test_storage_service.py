@@ -0,0 +1,129 @@
+import asyncio
+import datetime
+import os
+import stat
+import time
+import pytest
+from database_manager import DatabaseEnums, DatabaseManager
+from launcher import split_shards
+from storage_service import StorageClient, StorageError, StorageServer
+
+SLOW_CALL_SECONDS = 0.2
+
+
+class SlowDatabaseManager(DatabaseManager):
+    async def get_user_lobbies(self, user_id: str):
+        await asyncio.sleep(SLOW_CALL_SECONDS)
+        return await super().get_user_lobbies(user_id)
+
+
+async def _serve(database: DatabaseManager, socket_path: str, timeout: float = 5.0):
+    await database.initialize()
+    server = StorageServer(database, socket_path)
+    await server.start()
+    client = StorageClient(socket_path, timeout=timeout)
+    await client.initialize(retries=1)
+    return server, client
+
+
+async def _shutdown(server: StorageServer, client: StorageClient):
+    await client.close()
+    await server.drain(1.0)
+
+
+def test_round_trip(db_file, tmp_path):
+    async def scenario():
+        server, client = await _serve(DatabaseManager(), str(tmp_path / "storage.sock"))
+        try:
+            assert await client.create_lobby("1", "lobby", False, "secret") == DatabaseEnums.SUCCESS
+            assert await client.join_lobby("lobby", "2", "secret") == DatabaseEnums.SUCCESS
+            start = datetime.datetime(2026, 1, 1, 12, 0, tzinfo=datetime.timezone.utc)
+            assert await client.start_chrono("lobby", "2", start) == DatabaseEnums.SUCCESS
+            result, seconds = await client.stop_chrono("lobby", "2", start + datetime.timedelta(minutes=5))
+            assert (result, seconds) == (DatabaseEnums.SUCCESS, 300)
+            users = {user["user_id"]: user["total_seconds"] for user in await client.get_lobby_users("lobby")}
+            assert users == {"1": 0, "2": 300}
+        finally:
+            await _shutdown(server, client)
+    asyncio.run(scenario())
+
+
+def test_socket_is_private_and_removed(db_file, tmp_path):
+    socket_path = str(tmp_path / "storage.sock")
+
+    async def scenario():
+        server, client = await _serve(DatabaseManager(), socket_path)
+        assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+        await _shutdown(server, client)
+    asyncio.run(scenario())
+    assert not os.path.exists(socket_path)
+
+
+def test_requests_are_pipelined(db_file, tmp_path):
+    async def scenario():
+        server, client = await _serve(SlowDatabaseManager(), str(tmp_path / "storage.sock"))
+        try:
+            started = time.perf_counter()
+            results = await asyncio.gather(*(client.get_user_lobbies(str(i)) for i in range(20)))
+            elapsed = time.perf_counter() - started
+        finally:
+            await _shutdown(server, client)
+        assert results == [[]] * 20
+        # Serially these would take 20 * SLOW_CALL_SECONDS, the margin is for the database work itself
+        assert elapsed < 10 * SLOW_CALL_SECONDS
+    asyncio.run(scenario())
+
+
+def test_unknown_and_private_methods_are_rejected(db_file, tmp_path):
+    async def scenario():
+        server, client = await _serve(DatabaseManager(), str(tmp_path / "storage.sock"))
+        try:
+            with pytest.raises(StorageError, match="Unknown storage method"):
+                await client.call("initialize")
+            with pytest.raises(StorageError, match="Unknown storage method"):
+                await client.call("_execute", "DROP TABLE Lobbies")
+            with pytest.raises(AttributeError):
+                client.not_a_method
+        finally:
+            await _shutdown(server, client)
+    asyncio.run(scenario())
+
+
+def test_malformed_request_gets_an_answer(db_file, tmp_path):
+    async def scenario():
+        server, client = await _serve(DatabaseManager(), str(tmp_path / "storage.sock"))
+        try:
+            reader, writer = await asyncio.open_unix_connection(server.socket_path)
+            writer.write(b"not json\n")
+            await writer.drain()
+            response = await asyncio.wait_for(reader.readline(), 2.0)
+            assert b'"error"' in response
+            writer.close()
+            await writer.wait_closed()
+            # The service keeps serving other requests
+            assert await client.get_user_lobbies("1") == []
+        finally:
+            await _shutdown(server, client)
+    asyncio.run(scenario())
+
+
+def test_client_times_out(db_file, tmp_path):
+    async def scenario():
+        server, client = await _serve(SlowDatabaseManager(), str(tmp_path / "storage.sock"),
+                                      timeout=SLOW_CALL_SECONDS / 4)
+        try:
+            with pytest.raises(StorageError, match="timed out"):
+                await client.get_user_lobbies("1")
+            assert client._pending == {}
+        finally:
+            await _shutdown(server, client)
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("shard_count, workers", [(1, 1), (2, 2), (7, 3), (3, 8), (16, 4)])
+def test_split_shards(shard_count, workers):
+    ranges = split_shards(shard_count, workers)
+    assert len(ranges) == min(workers, shard_count)
+    assert [shard for shards in ranges for shard in shards] == list(range(shard_count))
+    sizes = [len(shards) for shards in ranges]
+    assert max(sizes) - min(sizes) <= 1
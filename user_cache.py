@@ -0,0 +1,42 @@
+from collections import OrderedDict
+from typing import Dict
+from discord import NotFound
+from discord.ext import commands
+
+
+class UserCache:
+    """Shared LRU cache of resolved user mentions so leaderboards and digests don't refetch members."""
+
+    def __init__(self, bot: commands.Bot, max_entries: int = 4096) -> None:
+        self.bot = bot
+        self.max_entries = max_entries
+        self._mentions: OrderedDict[str, str] = OrderedDict()
+
+    async def get_mention(self, user_id: str) -> str:
+        mention = self._mentions.get(user_id)
+        if mention is not None:
+            self._mentions.move_to_end(user_id)
+            return mention
+
+        user = self.bot.get_user(int(user_id))
+        if user is not None:
+            mention = user.mention
+        else:
+            try:
+                user = await self.bot.fetch_user(int(user_id))
+                mention = user.mention
+            except NotFound:
+                mention = f"Unknown User ({user_id})"
+
+        self._mentions[user_id] = mention
+        while len(self._mentions) > self.max_entries:
+            self._mentions.popitem(last=False)
+        return mention
+
+    def export(self) -> Dict[str, str]:
+        return dict(self._mentions)
+
+    def load(self, mentions: Dict[str, str]):
+        self._mentions.update(mentions)
+        while len(self._mentions) > self.max_entries:
+            self._mentions.popitem(last=False)
@@ -0,0 +1,36 @@
+import json
+import os
+from typing import Any, Dict
+
+# Snapshot of in-memory state written on graceful shutdown and consumed on the next boot.
+
+SNAPSHOT_VERSION = 1
+
+
+def save_warm_state(path: str, state: Dict[str, Any]):
+    partial_path = path + ".partial"
+    with open(partial_path, "w", encoding="utf-8") as f:
+        json.dump({"version": SNAPSHOT_VERSION, **state}, f)
+    os.replace(partial_path, path)
+    print(f"Wrote warm-start snapshot to {path}")
+
+
+def load_warm_state(path: str) -> Dict[str, Any]:
+    '''
+    Returns an empty dict if there is no usable snapshot. The file is removed
+    so a crash later on can't bring back state that is out of date.
+    '''
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable warm-start snapshot {path}: {e}")
+        state = {}
+    os.remove(path)
+
+    if state.get("version") != SNAPSHOT_VERSION:
+        return {}
+    print(f"Loaded warm-start snapshot from {path}")
+    return state